@@ -2,21 +2,85 @@
 Vercel serverless: POST /api/analyze — GPT daily analysis, stores entry in Supabase.
 Requires: OPENAI_API_KEY, SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY
 """
-import json
+import functools
 import os
 import re
+import sys
 from http.server import BaseHTTPRequestHandler
 
+import orjson
+from supabase import create_client
+
+from api.openai_client import get_openai
+from api.security import SECURITY_HEADERS, encrypt, get_user_id, parse_checkin
+from api.topics import topics_covered
+
 SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
 SUPABASE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or os.environ.get("SUPABASE_ANON_KEY", "")
 SUPABASE_ANON_KEY = os.environ.get("SUPABASE_ANON_KEY") or os.environ.get("EXPO_PUBLIC_SUPABASE_KEY", "")
-OPENAI_KEY = os.environ.get("OPENAI_API_KEY", "")
+OPENAI_KEY = (os.environ.get("OPENAI_API_KEY") or "").strip()
+
+# Strict JSON schema for the daily report: the model must return exactly these
+# keys with these types, so the response parses without any cleanup.
+_STR = {"type": "string"}
+_REPORT_PROPERTIES = {
+    "reflection_summary": _STR,
+    "core_bottleneck": _STR,
+    "likely_drivers": {"type": "array", "items": _STR},
+    "predicted_impact": _STR,
+    "experiment_for_tomorrow": _STR,
+    "micro_interventions": {"type": "array", "items": _STR},
+    "is_outlier": {"type": "boolean"},
+    "outlier_reason": {"type": ["string", "null"]},
+}
+
+
+def _json_schema_format(name: str, properties: dict) -> dict:
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": name,
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": properties,
+                "required": list(properties),
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+def _nullable(schema: dict) -> dict:
+    types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+    return {**schema, "type": types if "null" in types else [*types, "null"]}
+
+
+ANALYSIS_RESPONSE_FORMAT = _json_schema_format("signal_report", _REPORT_PROPERTIES)
+# The follow-up decision plus the report, so one call covers both. Report fields are
+# nullable so that when the model asks a question it doesn't also write a report that
+# would be thrown away (the answer triggers a fresh analysis).
+FOLLOW_UP_RESPONSE_FORMAT = _json_schema_format(
+    "signal_report_follow_up",
+    {"needs_answer": {"type": ["string", "null"]}, **{k: _nullable(v) for k, v in _REPORT_PROPERTIES.items()}},
+)
+
+_FOLLOW_UP_RULE = """
+FOLLOW-UP CHECK (decide this first): Is there ONE critical performance question (sleep, energy, focus, work output) that would significantly improve the analysis if the user answered it? Focus on PERFORMANCE only.
+- If the reflection is very short or only mentions sleep, ask about energy or focus (e.g. "How was your energy and focus today?")
+- If yes, set "needs_answer" to exactly one short question ending with ? and set EVERY other field to null: do not write the report
+- If the reflection is detailed enough, set "needs_answer" to null and fill in every report field
+"""
 
+# Any of these in a short reflection counts as covering energy/focus
+# ("focus" also matches "focused", "work" also matches "deep work").
+_SHORT_ENERGY_RE = re.compile(r"energy|tired|drained|focus|productive|work")
 
+@functools.lru_cache(maxsize=1)
 def get_supabase():
+    """Service-role client, built once per process so warm requests reuse its connections."""
     if not SUPABASE_URL or not SUPABASE_KEY:
         return None
-    from supabase import create_client
     return create_client(SUPABASE_URL, SUPABASE_KEY)
 
 
@@ -25,52 +89,40 @@ def get_supabase_for_user(access_token: str):
     Falls back to service-role client if anon key isn't configured."""
     if not SUPABASE_URL or not SUPABASE_ANON_KEY or not access_token:
         return get_supabase()
-    from supabase import create_client
+    return _user_client(access_token)
+
+
+@functools.lru_cache(maxsize=64)
+def _user_client(access_token: str):
+    """Per-token client, reused while the same session keeps calling (tokens expire, so the cache turns over)."""
     client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
     client.postgrest.auth(access_token)
     return client
 
 
-def check_missing_answer(transcript: str, sleep_hours: float, sleep_quality: int, energy: int, deep_work: int) -> str | None:
-    """If a critical performance question is unanswered, return it. Otherwise return None."""
+def check_missing_answer(transcript: str) -> str | None:
+    """Local check: return a follow-up question for short reflections that skip energy/focus."""
     t = (transcript or "").strip()
-    if not t or len(t) < 10:
-        return None
-    # Short reflections (< 80 chars) always need more — skip GPT, prompt directly
-    if len(t) < 80:
-        t_lower = t.lower()
-        has_energy = any(w in t_lower for w in ["energy", "tired", "drained", "focused", "focus", "productive", "work", "deep work"])
-        if not has_energy:
-            return "How was your energy and focus today?"
-    if not OPENAI_KEY:
-        return None
-    try:
-        import openai
-        client = openai.OpenAI(api_key=OPENAI_KEY)
-        prompt = f"""You are Signal, a performance pattern detection engine. Anchors: sleep {sleep_hours}h, quality {sleep_quality}/5, energy {energy}/5, deep work {deep_work}.
-
-Reflection: {transcript[:800]}
-
-Is there ONE critical performance question (sleep, energy, focus, work output) that would significantly improve the analysis if the user answered it? Focus on PERFORMANCE only.
-- If reflection is very short or only mentions sleep, ask about energy or focus (e.g. "How was your energy and focus today?")
-- If reflection is detailed enough, return: NONE
-
-If yes, return exactly one short question ending with ?
-If no, return: NONE"""
-        r = client.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": prompt}], temperature=0.2, max_tokens=80)
-        full = (r.choices[0].message.content or "").strip()
-        if not full or full.upper() == "NONE":
-            return None
-        if full.endswith("?"):
-            return full
-        return None
-    except Exception:
+    if len(t) < 10 or len(t) >= 80:
         return None
+    if not _SHORT_ENERGY_RE.search(t.lower()):
+        return "How was your energy and focus today?"
+    return None
+
+
+def needs_follow_up_check(transcript: str) -> bool:
+    """True when the keyword checks can't tell if a follow-up is needed, so GPT should decide."""
+    t = (transcript or "").strip()
+    if len(t) < 10 or len(t) >= 300:
+        return False
+    # Sleep, feeling and activity all mentioned: nothing to ask
+    return not topics_covered(t.lower())
 
 
-def analyze_with_gpt(transcript: str, sleep_hours: float, sleep_quality: int, energy: int, deep_work: int, api_key: str = None) -> dict:
-    """Call GPT to generate structured output. Returns dict with reflection_summary, likely_drivers, predicted_impact, experiment_for_tomorrow."""
-    key = (api_key or OPENAI_KEY or "").strip()
+def analyze_with_gpt(transcript: str, sleep_hours: float, sleep_quality: int, energy: int, deep_work: int, api_key: str = None, ask_follow_up: bool = False) -> dict:
+    """Call GPT to generate structured output. Returns dict with reflection_summary, likely_drivers, predicted_impact, experiment_for_tomorrow.
+    With ask_follow_up, the same call also decides whether to ask one question first; if so the dict has needs_answer."""
+    key = api_key.strip() if api_key else OPENAI_KEY
     if not key:
         return {
             "reflection_summary": transcript[:200] + ("..." if len(transcript) > 200 else ""),
@@ -80,8 +132,7 @@ def analyze_with_gpt(transcript: str, sleep_hours: float, sleep_quality: int, en
             "_error": "OPENAI_API_KEY not set in .env",
         }
     try:
-        import openai
-        client = openai.OpenAI(api_key=key)
+        client = get_openai(key)
         prompt = f"""You are "Signal", a cognitive performance analysis engine. Your job is to generate a daily reflection grounded in behavioral science, cognitive psychology, and neuroscience.
 
 INPUTS:
@@ -100,7 +151,7 @@ RULES:
 6. Tone: Analytical. Precise. Non-emotional. No hype. No moralising. No fluff.
 7. LIFE EVENT DETECTION: If the user mentions an acute, one-off life event (family emergency, illness, bereavement, accident, major conflict), flag it as a contextual outlier. Do NOT treat it as a recurring pattern. In your analysis, note "This appears to be an acute situational disruption, not a recurring behavioral pattern." The experiment should focus on recovery and damage-limitation (e.g., protect sleep, reduce decision load) rather than optimization.
 8. BIAS DETECTION: If the reflection is heavily one-sided (only positive or only negative) or off-topic (unrelated business encounters, gossip), note the limitation in your reflection_summary: "Note: This reflection may not capture the full picture — [reason]." Still generate the best analysis possible from available data.
-
+{_FOLLOW_UP_RULE if ask_follow_up else ''}
 Return valid JSON only. No markdown. Structure:
 {{
   "reflection_summary": "100-150 words. Must cite observable behaviors from today. If no behavioral evidence: 'Insufficient data'.",
@@ -117,45 +168,21 @@ Return valid JSON only. No markdown. Structure:
             messages=[{"role": "user", "content": prompt}],
             temperature=0.3,
             max_tokens=2500,
+            response_format=FOLLOW_UP_RESPONSE_FORMAT if ask_follow_up else ANALYSIS_RESPONSE_FORMAT,
         )
-        text = (r.choices[0].message.content or "").strip()
+        text = r.choices[0].message.content
         if not text:
             raise ValueError("Empty response from GPT")
-        if text.startswith("```"):
-            text = text.split("```")[1]
-            if text.lower().startswith("json"):
-                text = text[4:]
-            text = text.strip()
-        start = text.find("{")
-        end = text.rfind("}") + 1
-        if start >= 0 and end > start:
-            text = text[start:end]
-        # Fix common JSON issues: trailing commas
-        text = re.sub(r",\s*}", "}", text)
-        text = re.sub(r",\s*]", "]", text)
-        data = json.loads(text)
-        # Ensure required keys exist
-        data.setdefault("reflection_summary", "")
-        data.setdefault("likely_drivers", [])
-        data.setdefault("predicted_impact", "")
-        data.setdefault("experiment_for_tomorrow", "")
-
-        # Normalize fields that GPT may return as dicts instead of strings
-        for str_field in ("reflection_summary", "predicted_impact", "experiment_for_tomorrow", "core_bottleneck"):
-            val = data.get(str_field)
-            if isinstance(val, dict):
-                data[str_field] = "\n".join(f"{k}: {v}" for k, v in val.items())
-
-        # Normalize likely_drivers: GPT may return list of dicts instead of strings
-        drivers = data.get("likely_drivers", [])
-        if isinstance(drivers, list):
-            normalized = []
-            for d in drivers:
-                if isinstance(d, dict):
-                    normalized.append(" — ".join(f"{k}: {v}" for k, v in d.items()))
-                else:
-                    normalized.append(str(d))
-            data["likely_drivers"] = normalized
+        data = orjson.loads(text)
+
+        question = (data.pop("needs_answer", None) or "").strip()
+        if question.endswith("?"):
+            return {"needs_answer": question}
+        if not data.get("reflection_summary") or not data.get("experiment_for_tomorrow"):
+            # Follow-up format with no question but a null report: treat as a failed call
+            raise ValueError("Incomplete report from GPT")
+        data["predicted_impact"] = data.get("predicted_impact") or ""
+        data["likely_drivers"] = data.get("likely_drivers") or []
 
         # Merge core_bottleneck into reflection_summary for display
         core = data.get("core_bottleneck", "")
@@ -169,42 +196,12 @@ Return valid JSON only. No markdown. Structure:
 
         # Append micro_interventions to experiment
         micro = data.get("micro_interventions") or []
-        if isinstance(micro, list):
-            micro = [str(m) if not isinstance(m, str) else m for m in micro]
-        exp = data.get("experiment_for_tomorrow", "")
         if micro:
-            exp += "\n\nMicro-interventions:\n" + "\n".join(f"• {m}" for m in micro[:3])
-            data["experiment_for_tomorrow"] = exp
+            data["experiment_for_tomorrow"] += "\n\nMicro-interventions:\n" + "\n".join(f"• {m}" for m in micro[:3])
         return data
     except Exception as e:
-        import sys
         err_msg = f"{type(e).__name__}: {str(e)}"
         print("[analyze] GPT failed:", err_msg, file=sys.stderr)
-        # Retry with minimal prompt (create fresh client in case first failed early)
-        try:
-            import openai as _openai
-            _client = _openai.OpenAI(api_key=key)
-            simple_prompt = f"""Based on: Sleep {sleep_hours}h, quality {sleep_quality}/5, energy {energy}/5, deep work {deep_work} blocks. Notes: {transcript[:500]}
-
-Return JSON only:
-{{"reflection_summary": "2-3 sentence summary of performance factors", "core_bottleneck": "one sentence", "likely_drivers": ["driver 1", "driver 2"], "predicted_impact": "1-2 sentences", "experiment_for_tomorrow": "one concrete experiment", "micro_interventions": []}}"""
-            r2 = _client.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": simple_prompt}], temperature=0.2, max_tokens=800)
-            text = (r2.choices[0].message.content or "").strip()
-            start, end = text.find("{"), text.rfind("}") + 1
-            if start >= 0 and end > start:
-                text = text[start:end]
-            text = re.sub(r",\s*}", "}", re.sub(r",\s*]", "]", text))
-            data = json.loads(text)
-            data.setdefault("reflection_summary", "")
-            data.setdefault("likely_drivers", [])
-            data.setdefault("predicted_impact", "")
-            data.setdefault("experiment_for_tomorrow", "")
-            core = data.get("core_bottleneck", "")
-            if core:
-                data["reflection_summary"] = f"Core bottleneck: {core}\n\n{data.get('reflection_summary', '')}"
-            return data
-        except Exception as e2:
-            print("[analyze] Retry also failed:", str(e2), file=sys.stderr)
         return {
             "reflection_summary": transcript[:200] or "No reflection provided.",
             "likely_drivers": ["Analysis pending"],
@@ -214,9 +211,29 @@ Return JSON only:
         }
 
 
+def _save_entry_fallback(supabase, row: dict, overwrite: bool) -> dict:
+    """Select-then-insert version of upsert_entry, for databases without supabase-upsert-entry.sql."""
+    existing = supabase.table("entries").select("id, entry_number, sleep_hours, sleep_quality, energy, deep_work_blocks").eq(
+        "user_id", row["user_id"]).eq("date", row["date"]).order("entry_number", desc=True).execute()
+    existing_entries = existing.data or []
+    if overwrite and existing_entries:
+        latest = existing_entries[0]
+        update_row = {k: v for k, v in row.items() if k not in ("user_id", "date", "is_follow_up")}
+        supabase.table("entries").update(update_row).eq("id", latest["id"]).execute()
+        return {"id": latest["id"], "entry_number": latest["entry_number"], "overwritten": True}
+
+    row = dict(row, entry_number=(existing_entries[0]["entry_number"] + 1) if existing_entries else 1)
+    row["is_follow_up"] = row["is_follow_up"] and row["entry_number"] > 1
+    if row["is_follow_up"]:
+        first = existing_entries[-1]
+        for col in ("sleep_hours", "sleep_quality", "energy", "deep_work_blocks"):
+            row[col] = first.get(col) or row[col]
+    r = supabase.table("entries").insert(row).execute()
+    return {"id": r.data[0]["id"] if r.data else None, "entry_number": row["entry_number"]}
+
+
 class handler(BaseHTTPRequestHandler):
     def _get_user_id(self):
-        from api.security import get_user_id
         return get_user_id(self.headers.get("Authorization", ""))
 
     def do_POST(self):
@@ -226,10 +243,10 @@ class handler(BaseHTTPRequestHandler):
             return
 
         content_len = int(self.headers.get("Content-Length", 0))
-        raw = self.rfile.read(content_len).decode("utf-8") if content_len else "{}"
+        raw = self.rfile.read(content_len) if content_len else b"{}"
         try:
-            data = json.loads(raw)
-        except json.JSONDecodeError:
+            data = orjson.loads(raw)
+        except orjson.JSONDecodeError:
             self._send(400, {"error": "Invalid JSON"})
             return
 
@@ -238,48 +255,36 @@ class handler(BaseHTTPRequestHandler):
             self._send(503, {"error": "Server not configured"})
             return
 
-        from api.security import sanitize_text, clamp_float, clamp_int, validate_date, encrypt
-
-        transcript = sanitize_text(data.get("transcript", "") or "", max_length=5000)
-        sleep_hours = clamp_float(data.get("sleep_hours", 0), 0, 24, default=0)
-        sleep_quality = clamp_int(data.get("sleep_quality", 3), 1, 5, default=3)
-        energy = clamp_int(data.get("energy", 3), 1, 5, default=3)
-        deep_work = clamp_int(data.get("deep_work_blocks", 0), 0, 5, default=0)
-        entry_date = validate_date(data.get("date", ""))
+        transcript, sleep_hours, sleep_quality, energy, deep_work, entry_date = parse_checkin(data)
         if not entry_date:
             self._send(400, {"error": "Valid date required (YYYY-MM-DD)"})
             return
 
+        anchors = (transcript, sleep_hours, sleep_quality, energy, deep_work)
         if not data.get("skip_missing_check") and not data.get("overwrite"):
-            missing = check_missing_answer(transcript, sleep_hours, sleep_quality, energy, deep_work)
+            missing = check_missing_answer(transcript)
             if missing:
                 self._send(200, {"needs_answer": missing})
                 return
-
-        result = analyze_with_gpt(transcript, sleep_hours, sleep_quality, energy, deep_work)
+            # Ambiguous reflections: GPT decides on a follow-up in the same call as the analysis
+            result = analyze_with_gpt(*anchors, ask_follow_up=needs_follow_up_check(transcript))
+            if result.get("needs_answer"):
+                self._send(200, {"needs_answer": result["needs_answer"]})
+                return
+        else:
+            result = analyze_with_gpt(*anchors)
 
         if result.get("likely_drivers") == ["Analysis pending"]:
             self._send(503, {"error": "Analysis failed. Add OPENAI_API_KEY to Vercel Environment Variables (Settings → Environment Variables) and redeploy."})
             return
 
-        is_follow_up = data.get("is_follow_up") is True
-        existing = supabase.table("entries").select("id, entry_number, sleep_hours, sleep_quality, energy, deep_work_blocks").eq(
-            "user_id", user_id).eq("date", entry_date).order("entry_number", desc=True).execute()
-        existing_entries = existing.data or []
-        next_number = (existing_entries[0]["entry_number"] + 1) if existing_entries else 1
-
-        if is_follow_up and existing_entries:
-            first = existing_entries[-1]
-            sleep_hours = first.get("sleep_hours") or sleep_hours
-            sleep_quality = first.get("sleep_quality") or sleep_quality
-            energy = first.get("energy") or energy
-            deep_work = first.get("deep_work_blocks") or deep_work
-
+        # upsert_entry (supabase-upsert-entry.sql) numbers the entry, copies the
+        # day's anchors onto follow-ups and inserts it in a single round trip;
+        # without it, _save_entry_fallback does the same in two.
         row = {
             "user_id": user_id,
             "date": entry_date,
-            "entry_number": next_number,
-            "is_follow_up": is_follow_up and next_number > 1,
+            "is_follow_up": data.get("is_follow_up") is True,
             "sleep_hours": sleep_hours,
             "sleep_quality": sleep_quality,
             "energy": energy,
@@ -291,17 +296,30 @@ class handler(BaseHTTPRequestHandler):
             "experiment_for_tomorrow": encrypt(result.get("experiment_for_tomorrow", "")),
         }
 
+        overwrite = data.get("overwrite") is True
         try:
-            r = supabase.table("entries").insert(row).execute()
-            entry_id = r.data[0]["id"] if r.data else None
-            self._send(200, {"entry_id": str(entry_id), "entry_number": next_number})
+            try:
+                r = supabase.rpc("upsert_entry", {"p_row": row, "p_overwrite": overwrite}).execute()
+                saved = r.data[0] if r.data else {}
+            except Exception as e:
+                # Only "function not found" (PostgREST PGRST202 / Postgres 42883) falls back:
+                # after any other error the row may already be written
+                if "PGRST202" not in str(e) and "42883" not in str(e):
+                    raise
+                saved = _save_entry_fallback(supabase, row, overwrite)
+            out = {"entry_id": str(saved.get("id")), "entry_number": saved.get("entry_number")}
+            if saved.get("overwritten"):
+                out["overwritten"] = True
+            self._send(200, out)
         except Exception as e:
             self._send(500, {"error": str(e)})
 
     def _send(self, status, body):
+        payload = orjson.dumps(body)
         self.send_response(status)
         self.send_header("Content-type", "application/json")
-        self.send_header("X-Content-Type-Options", "nosniff")
-        self.send_header("X-Frame-Options", "DENY")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in SECURITY_HEADERS:
+            self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(json.dumps(body).encode("utf-8"))
+        self.wfile.write(payload)
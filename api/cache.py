@@ -0,0 +1,41 @@
+"""
+Small in-process caches shared by server.py and the Vercel handlers.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def text_key(text: str) -> bytes:
+    """Hash of text with case and whitespace normalized: "Slept  fine" and "slept fine" share an entry."""
+    return hashlib.blake2b(" ".join(text.lower().split()).encode("utf-8"), digest_size=16).digest()
+
+
+class LRUCache:
+    """Bounded least-recently-used cache with an optional TTL in seconds. Locked for gunicorn's threads."""
+
+    def __init__(self, maxsize: int, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """The cached value, or None if missing or expired."""
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return None
+            if self.ttl is not None and time.monotonic() - hit[0] > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return hit[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
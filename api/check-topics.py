@@ -2,33 +2,41 @@
 Vercel serverless: POST /api/check-topics — GPT checks which reflection questions are missing.
 Requires: OPENAI_API_KEY
 """
-import json
 import os
-import re
 from http.server import BaseHTTPRequestHandler
 
-OPENAI_KEY = os.environ.get("OPENAI_API_KEY", "")
+import orjson
 
+from api.cache import LRUCache, text_key
+from api.openai_client import get_openai
+from api.security import sanitize_text
+from api.topics import TOPIC_QUESTIONS, fallback_check_topics as _fallback_check_topics
 
-def _fallback_check_topics(text: str) -> list:
-    t = text.lower()
-    missing = []
-    if not re.search(r"\b(sleep|slept|rest|woke|nap|bed|insomnia|alright|well|hours?|asleep|restorative|restless)\b", t):
-        missing.append("How did you sleep?")
-    if not re.search(r"\b(feel|felt|feeling|energy|mood|stressed|anxious|happy|sad|tired|exhausted|drained|bothered|down|low|great|calm|relaxed|motivated|restless|groggy|heavy)\b", t) and not re.search(r"(feel|i'm|im)\s+(okay|fine|good|bad)", t):
-        missing.append("What are you feeling?")
-    if not re.search(r"\b(work|worked|attempt|tried|did|task|project|focus|study|meeting|class|productive|unproductive|nothing|read|exercise|chilled)\b", t):
-        missing.append("What did you attempt?")
-    return missing
+OPENAI_KEY = (os.environ.get("OPENAI_API_KEY") or "").strip()
 
+# Strict schema: "missing" may only contain the three topic questions
+TOPICS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "missing_topics",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"missing": {"type": "array", "items": {"type": "string", "enum": TOPIC_QUESTIONS}}},
+            "required": ["missing"],
+            "additionalProperties": False,
+        },
+    },
+}
 
-def check_topics_with_gpt(text: str) -> list:
-    if not OPENAI_KEY or len(text.strip()) < 5:
-        return ["How did you sleep?", "What are you feeling?", "What did you attempt?"] if len(text.strip()) < 5 else []
-    try:
-        import openai
-        client = openai.OpenAI(api_key=OPENAI_KEY)
-        prompt = f"""A user's daily reflection must meaningfully address 3 topics. A vague mention is NOT enough — they need to provide real detail.
+
+# GPT verdicts by transcript hash, so re-submitting the same text while editing
+# skips the OpenAI call for the life of this container. Fallback results aren't cached.
+_topics_cache = LRUCache(256)
+
+
+# Fixed rubric as the system message, reflection last: every call shares the same prefix
+_TOPICS_INSTRUCTIONS = """A user's daily reflection must meaningfully address 3 topics. A vague mention is NOT enough — they need to provide real detail.
 
 TOPIC 1 — "How did you sleep?"
 ADDRESSED: they give AT LEAST TWO specifics: duration, quality description, disruptions, bedtime, or how they woke up.
@@ -49,19 +57,39 @@ ADDRESSED: they describe what they worked on, tried, or did during the day (or s
 "worked on my project", "did nothing today", "went to class" → ADDRESSED
 No mention of any activity → NOT ADDRESSED
 
-Reflection: "{text[:1200]}"
-
-Return JSON array of MISSING topics. Use exact strings:
+Return JSON {"missing": [...]} listing the MISSING topics. Use exact strings:
 ["How did you sleep?", "What are you feeling?", "What did you attempt?"]
-Return [] only if ALL three are meaningfully addressed with detail."""
-        r = client.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": prompt}], temperature=0.1, max_tokens=100)
-        raw = (r.choices[0].message.content or "").strip()
-        if raw.startswith("```"): raw = raw.split("```")[1].replace("json", "").strip()
-        out = json.loads(raw)
-        missing = [q for q in out if isinstance(q, str) and q in ("How did you sleep?", "What are you feeling?", "What did you attempt?")]
-        return missing
+Return {"missing": []} only if ALL three are meaningfully addressed with detail."""
+
+
+def check_topics_with_gpt(text: str) -> list:
+    if not OPENAI_KEY or len(text.strip()) < 5:
+        return list(TOPIC_QUESTIONS) if len(text.strip()) < 5 else []
+    # Keywords for every topic: accept without a GPT round trip. GPT only
+    # double-checks when the regex thinks something is missing.
+    fallback = _fallback_check_topics(text)
+    if not fallback:
+        return []
+    key = text_key(text)
+    cached = _topics_cache.get(key)
+    if cached is not None:
+        return list(cached)
+    try:
+        client = get_openai(OPENAI_KEY)
+        r = client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": _TOPICS_INSTRUCTIONS},
+                {"role": "user", "content": f'Reflection: "{text[:1200]}"'},
+            ],
+            temperature=0.1, max_tokens=100,
+            response_format=TOPICS_RESPONSE_FORMAT,
+        )
+        missing = orjson.loads(r.choices[0].message.content)["missing"]
     except Exception:
-        return _fallback_check_topics(text)
+        return fallback
+    _topics_cache.put(key, tuple(missing))
+    return missing
 
 
 class handler(BaseHTTPRequestHandler):
@@ -74,19 +102,22 @@ class handler(BaseHTTPRequestHandler):
 
     def do_POST(self):
         content_len = int(self.headers.get("Content-Length", 0))
-        raw = self.rfile.read(content_len).decode("utf-8") if content_len else "{}"
+        raw = self.rfile.read(content_len) if content_len else b"{}"
         try:
-            data = json.loads(raw)
-        except json.JSONDecodeError:
+            data = orjson.loads(raw)
+        except orjson.JSONDecodeError:
             self._send(400, {"missing": ["How did you sleep?", "What are you feeling?", "What did you attempt?"]})
             return
-        text = (data.get("text") or "").strip()
+        # Same cap as server.py: bounds the hash and keyword scan on oversized bodies
+        text = sanitize_text(data.get("text") or "", max_length=2000)
         missing = check_topics_with_gpt(text)
         self._send(200, {"missing": missing})
 
     def _send(self, status, body):
+        payload = orjson.dumps(body)
         self.send_response(status)
         self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
         self.send_header("Access-Control-Allow-Origin", "*")
         self.end_headers()
-        self.wfile.write(json.dumps(body).encode("utf-8"))
+        self.wfile.write(payload)
@@ -2,60 +2,98 @@
 Vercel serverless: POST /api/clarify — GPT clarifying questions as user types.
 Requires: OPENAI_API_KEY
 """
-import json
 import os
+import re
 from http.server import BaseHTTPRequestHandler
 
-OPENAI_KEY = os.environ.get("OPENAI_API_KEY", "")
+import orjson
 
+from api.cache import LRUCache, text_key
+from api.openai_client import get_openai
+from api.security import sanitize_text
+
+OPENAI_KEY = (os.environ.get("OPENAI_API_KEY") or "").strip()
+
+# GPT questions by hash of the text the prompt sees, so debounced re-sends of the
+# same draft skip the OpenAI call for the life of this container. Failures aren't cached.
+_clarify_cache = LRUCache(256)
 
-def clarify_with_gpt(text: str) -> list:
-    """Return 1-2 short clarifying questions based on partial reflection."""
-    if not text or len(text.strip()) < 15:
-        return []
-    if not OPENAI_KEY:
-        return []
-    try:
-        import openai
-        client = openai.OpenAI(api_key=OPENAI_KEY)
-        prompt = f"""You are Signal, a performance pattern detection engine. You detect factors impacting productivity. You do NOT provide therapy. NEVER ask about feelings, emotions, relationships, or personal life.
 
-User's reflection so far:
+def strip_code_fence(raw: str) -> str:
+    """Return the body of a leading ```/```json fence, or raw unchanged."""
+    if not raw.startswith("```"):
+        return raw
+    end = raw.find("```", 3)
+    inner = raw[3:end] if end != -1 else raw[3:]
+    return inner.removeprefix("json").strip()
 
-"{text[:500]}"
 
-Generate 1-2 clarifying questions about PERFORMANCE ONLY. Ask ONLY about: sleep, energy, focus, work output, what blocked them.
+# Fixed instructions go first, as the system message, and the reflection last, so every
+# request shares the same prompt prefix (OpenAI prompt caching matches on prefixes)
+CLARIFY_INSTRUCTIONS = """You are Signal, a performance pattern detection engine. You detect factors impacting productivity. You do NOT provide therapy. NEVER ask about feelings, emotions, relationships, or personal life.
+
+Generate 1-2 clarifying questions about PERFORMANCE ONLY for the user's reflection so far. Ask ONLY about: sleep, energy, focus, work output, what blocked them.
 
 BAD (therapeutic - never do this): "What's causing you to feel blue?", "Can you share more about your relationship?", "What do you think is missing?"
 GOOD (performance): "How did that affect your energy for work today?", "What got in the way of your focus?", "How did your sleep factor in?"
 
 Return JSON array only: ["question1?", "question2?"]."""
-        r = client.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": prompt}], temperature=0.4)
+
+
+def clarify_messages(text: str) -> list:
+    """Chat messages for the clarify call (also used by server.py's /api/clarify)."""
+    return [
+        {"role": "system", "content": CLARIFY_INSTRUCTIONS},
+        {"role": "user", "content": f'User\'s reflection so far:\n\n"{text[:500]}"'},
+    ]
+
+
+def clarify_with_gpt(text: str) -> list:
+    """Return 1-2 short clarifying questions based on partial reflection."""
+    if not text or len(text.strip()) < 15:
+        return []
+    if not OPENAI_KEY:
+        return []
+    key = text_key(text[:500])
+    cached = _clarify_cache.get(key)
+    if cached is not None:
+        return list(cached)
+    try:
+        client = get_openai(OPENAI_KEY)
+        r = client.chat.completions.create(
+            model="gpt-4o-mini", messages=clarify_messages(text), temperature=0.4,
+        )
         raw = r.choices[0].message.content.strip()
-        if raw.startswith("```"): raw = raw.split("```")[1].replace("json", "").strip()
-        out = json.loads(raw)
-        return out if isinstance(out, list) else []
+        out = orjson.loads(strip_code_fence(raw))
     except Exception:
         return []
-
-
-def _fallback_clarify(text: str) -> list:
-    t = text.lower()
-    questions = []
-    if any(w in t for w in ["blue", "down", "bothered", "sad", "don't feel", "dont feel"]):
-        questions.append("How did that affect your energy for work today?")
-    if any(w in t for w in ["unproductive", "unfocused", "wasted", "sat the whole day"]):
-        questions.append("What got in the way of feeling productive today?")
-    if any(w in t for w in ["tired", "exhausted", "drained"]):
-        questions.append("How did you sleep last night?")
-    if any(w in t for w in ["unsure", "confused", "bored", "unmotivated", "not sure"]):
-        questions.append("What did you attempt today that mattered to you?")
-    if any(w in t for w in ["fight", "argument", "conflict", "bf", "boyfriend", "girlfriend"]):
-        questions.append("How did that affect your energy for work today?")
-    if any(w in t for w in ["stress", "anxious", "overwhelmed", "stuck"]):
-        questions.append("What got in the way of your focus?")
-    if any(w in t for w in ["sleep", "slept", "rest", "woke", "wake"]):
-        questions.append("What might have affected your sleep quality?")
+    questions = out if isinstance(out, list) else []
+    _clarify_cache.put(key, tuple(questions))
+    return questions
+
+
+# Fallback keyword rules, in priority order. One combined regex finds every rule
+# that fires in a single scan; the leading \b stops matches inside other words
+# ("interest" no longer counts as "rest") while still allowing "stressed", "sleepy".
+_CLARIFY_RULES = [
+    (("blue", "down", "bothered", "sad", "don't feel", "dont feel"), "How did that affect your energy for work today?"),
+    (("unproductive", "unfocused", "wasted", "sat the whole day"), "What got in the way of feeling productive today?"),
+    (("tired", "exhausted", "drained", "low energy"), "How did you sleep last night?"),
+    (("unsure", "confused", "bored", "unmotivated", "not sure"), "What did you attempt today that mattered to you?"),
+    (("fight", "argument", "conflict", "bf", "boyfriend", "girlfriend"), "How did that affect your energy for work today?"),
+    (("stress", "anxious", "overwhelmed", "stuck"), "What got in the way of your focus?"),
+    (("sleep", "slept", "rest", "woke", "wake"), "What might have affected your sleep quality?"),
+]
+_CLARIFY_RE = re.compile("|".join(
+    rf"(?P<r{i}>\b(?:{'|'.join(map(re.escape, words))}))" for i, (words, _) in enumerate(_CLARIFY_RULES)
+))
+
+
+def fallback_clarify(text: str) -> list:
+    """Keyword-rule clarifying questions (at most 2) for when GPT is unavailable."""
+    hit = {m.lastgroup for m in _CLARIFY_RE.finditer(text.lower())}
+    # Two rules share a question; dict.fromkeys keeps rule order and drops the repeat
+    questions = list(dict.fromkeys(q for i, (_, q) in enumerate(_CLARIFY_RULES) if f"r{i}" in hit))
     if not questions:
         questions.append("What got in the way of your best work today?")
     return questions[:2]
@@ -66,12 +104,12 @@ def _clarify_response(text: str) -> tuple:
     if len(text) < 15:
         return [], "none", None
     if not OPENAI_KEY:
-        return _fallback_clarify(text), "fallback", "OPENAI_API_KEY not set"
+        return fallback_clarify(text), "fallback", "OPENAI_API_KEY not set"
     try:
         q = clarify_with_gpt(text)
-        return (q, "gpt", None) if q else (_fallback_clarify(text), "fallback", None)
+        return (q, "gpt", None) if q else (fallback_clarify(text), "fallback", None)
     except Exception as e:
-        return _fallback_clarify(text), "fallback", str(e)
+        return fallback_clarify(text), "fallback", str(e)
 
 
 class handler(BaseHTTPRequestHandler):
@@ -84,19 +122,22 @@ class handler(BaseHTTPRequestHandler):
 
     def do_POST(self):
         content_len = int(self.headers.get("Content-Length", 0))
-        raw = self.rfile.read(content_len).decode("utf-8") if content_len else "{}"
+        raw = self.rfile.read(content_len) if content_len else b"{}"
         try:
-            data = json.loads(raw)
-        except json.JSONDecodeError:
+            data = orjson.loads(raw)
+        except orjson.JSONDecodeError:
             self._send(400, {"questions": []})
             return
-        text = (data.get("text") or "").strip()
+        # Same cap as server.py: bounds the hash and keyword scan on oversized bodies
+        text = sanitize_text(data.get("text") or "", max_length=2000)
         questions, source, err = _clarify_response(text)
         self._send(200, {"questions": questions, "source": source, "error": err or None})
 
     def _send(self, status, body):
+        payload = orjson.dumps(body)
         self.send_response(status)
         self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
         self.send_header("Access-Control-Allow-Origin", "*")
         self.end_headers()
-        self.wfile.write(json.dumps(body).encode("utf-8"))
+        self.wfile.write(payload)
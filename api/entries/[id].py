@@ -2,31 +2,48 @@
 Vercel serverless: GET /api/entries/<id> — fetch single entry.
 Requires: SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY
 """
-import json
-import re
+import functools
 from http.server import BaseHTTPRequestHandler
 from urllib.parse import urlparse
 
+import orjson
+from supabase import create_client
+
+from api.security import decrypt, get_user_id as _get_user_id, validate_uuid
+
 SUPABASE_URL = __import__("os").environ.get("SUPABASE_URL", "")
 SUPABASE_KEY = __import__("os").environ.get("SUPABASE_SERVICE_ROLE_KEY") or __import__("os").environ.get("SUPABASE_ANON_KEY", "")
 
 
+@functools.lru_cache(maxsize=1)
 def get_supabase():
     if not SUPABASE_URL or not SUPABASE_KEY:
         return None
-    from supabase import create_client
     return create_client(SUPABASE_URL, SUPABASE_KEY)
 
 
 def get_user_id(headers):
-    from api.security import get_user_id as _get_user_id
     return _get_user_id(headers.get("Authorization", ""))
 
 
-def validate_uuid(s):
-    if not s or not isinstance(s, str):
-        return False
-    return bool(re.match(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$", s.strip().lower()))
+def _entry_with_day_meta(supabase, entry_id, user_id):
+    """The entry plus its day's max_entry_number and entry_count, or None if it isn't the user's."""
+    try:
+        # One round trip (supabase-entry-detail.sql)
+        return supabase.rpc("get_entry_with_day_meta", {"p_entry_id": entry_id, "p_user_id": user_id}).execute().data
+    except Exception:
+        pass
+    rows = supabase.table("entries").select("*").eq("id", entry_id).eq("user_id", user_id).limit(1).execute().data
+    if not rows:
+        return None
+    entry = rows[0]
+    try:
+        same_day = supabase.table("entries").select("entry_number").eq("user_id", user_id).eq("date", entry.get("date")).execute()
+        nums = [r.get("entry_number") or 1 for r in (same_day.data or [])]
+        entry["max_entry_number"], entry["entry_count"] = max(nums, default=1), len(nums)
+    except Exception:
+        pass  # no entry_number column (supabase-multi-entries.sql not run): one entry per day
+    return entry
 
 
 class handler(BaseHTTPRequestHandler):
@@ -50,12 +67,10 @@ class handler(BaseHTTPRequestHandler):
             return
 
         try:
-            result = supabase.table("entries").select("*").eq("id", entry_id).eq("user_id", user_id).single().execute()
-            entry = result.data
+            entry = _entry_with_day_meta(supabase, entry_id, user_id)
             if not entry:
                 self._send(404, {"error": "Entry not found"})
                 return
-            from api.security import decrypt
             def safe_decrypt(val):
                 s = decrypt(val or "")
                 return "" if (s and s.startswith("gAAAAA")) else (s or "")
@@ -65,15 +80,9 @@ class handler(BaseHTTPRequestHandler):
             entry["predicted_impact"] = safe_decrypt(entry.get("predicted_impact"))
             entry["experiment_for_tomorrow"] = safe_decrypt(entry.get("experiment_for_tomorrow"))
             entry["likely_drivers"] = [safe_decrypt(d) for d in (entry.get("likely_drivers") or [])]
-            entry_date = entry.get("date")
-            entry_num = entry.get("entry_number") or 1
-            try:
-                same_day = supabase.table("entries").select("entry_number").eq("user_id", user_id).eq("date", entry_date).execute()
-                nums = [r.get("entry_number") or 1 for r in (same_day.data or [])]
-                max_num = max(nums) if nums else 1
-                entry["is_final_for_day"] = (entry_num == max_num) or (len(nums) == 1)
-            except Exception:
-                entry["is_final_for_day"] = True
+            max_num = entry.pop("max_entry_number", None) or 1
+            day_count = entry.pop("entry_count", 1)
+            entry["is_final_for_day"] = ((entry.get("entry_number") or 1) == max_num) or day_count <= 1
             self._send(200, {"data": entry})
         except Exception as e:
             err = str(e).lower()
@@ -83,8 +92,10 @@ class handler(BaseHTTPRequestHandler):
                 self._send(500, {"error": str(e)})
 
     def _send(self, status, body):
+        payload = orjson.dumps(body)
         self.send_response(status)
         self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
         self.send_header("Access-Control-Allow-Origin", "*")
         self.end_headers()
-        self.wfile.write(json.dumps(body).encode("utf-8"))
+        self.wfile.write(payload)
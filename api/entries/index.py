@@ -2,22 +2,27 @@
 Vercel serverless: GET /api/entries — list user's entries for history/analysis.
 Requires: SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY
 """
-import json
+import functools
+import hashlib
 from http.server import BaseHTTPRequestHandler
 
+import orjson
+from supabase import create_client
+
+from api.security import decrypt, get_user_id as _get_user_id
+
 SUPABASE_URL = __import__("os").environ.get("SUPABASE_URL", "")
 SUPABASE_KEY = __import__("os").environ.get("SUPABASE_SERVICE_ROLE_KEY") or __import__("os").environ.get("SUPABASE_ANON_KEY", "")
 
 
+@functools.lru_cache(maxsize=1)
 def get_supabase():
     if not SUPABASE_URL or not SUPABASE_KEY:
         return None
-    from supabase import create_client
     return create_client(SUPABASE_URL, SUPABASE_KEY)
 
 
 def get_user_id(headers):
-    from api.security import get_user_id as _get_user_id
     return _get_user_id(headers.get("Authorization", ""))
 
 
@@ -33,6 +38,23 @@ class handler(BaseHTTPRequestHandler):
             self._send(503, {"error": "Server not configured"})
             return
 
+        # ETag from the user's entry count + latest updated_at (supabase-entries-version.sql),
+        # so a browser revalidating with If-None-Match skips the fetch and decrypt below
+        etag = None
+        try:
+            version = supabase.rpc("entries_version", {"uid": user_id}).execute().data
+        except Exception:
+            version = None  # migration not run yet: serve without an ETag
+        if version:
+            etag = '"' + hashlib.blake2b(f"{user_id}:{version}".encode(), digest_size=8).hexdigest() + '"'
+            if etag in (self.headers.get("If-None-Match") or ""):
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", "private, no-cache")
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.end_headers()
+                return
+
         try:
             result = supabase.table("entries").select(
                 "id, date, sleep_hours, sleep_quality, energy, deep_work_blocks, reflection_summary, entry_number, is_follow_up"
@@ -42,19 +64,21 @@ class handler(BaseHTTPRequestHandler):
                 "id, date, sleep_hours, sleep_quality, energy, deep_work_blocks, reflection_summary"
             ).eq("user_id", user_id).order("date", desc=True).limit(90).execute()
 
+        # reflection_summary is the only encrypted text column selected for the list view
         entries = result.data or []
-        from api.security import decrypt
         for e in entries:
             e["reflection_summary"] = decrypt(e.get("reflection_summary") or "")
-            e["predicted_impact"] = decrypt(e.get("predicted_impact") or "")
-            e["experiment_for_tomorrow"] = decrypt(e.get("experiment_for_tomorrow") or "")
-            e["likely_drivers"] = [decrypt(d) for d in (e.get("likely_drivers") or [])]
 
-        self._send(200, {"data": entries})
+        self._send(200, {"data": entries}, etag)
 
-    def _send(self, status, body):
+    def _send(self, status, body, etag=None):
+        payload = orjson.dumps(body)
         self.send_response(status)
         self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "private, no-cache")
         self.send_header("Access-Control-Allow-Origin", "*")
         self.end_headers()
-        self.wfile.write(json.dumps(body).encode("utf-8"))
+        self.wfile.write(payload)
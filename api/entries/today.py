@@ -2,24 +2,29 @@
 Vercel serverless: GET /api/entries/today — count today's entries and unique days.
 Requires: SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY
 """
-import json
+import functools
+import hashlib
 import os
 from datetime import date
 from http.server import BaseHTTPRequestHandler
 
+import orjson
+from supabase import create_client
+
+from api.security import get_user_id as _get_user_id
+
 SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
 SUPABASE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or os.environ.get("SUPABASE_ANON_KEY", "")
 
 
+@functools.lru_cache(maxsize=1)
 def get_supabase():
     if not SUPABASE_URL or not SUPABASE_KEY:
         return None
-    from supabase import create_client
     return create_client(SUPABASE_URL, SUPABASE_KEY)
 
 
 def get_user_id(headers):
-    from api.security import get_user_id as _get_user_id
     return _get_user_id(headers.get("Authorization", ""))
 
 
@@ -37,6 +42,22 @@ class handler(BaseHTTPRequestHandler):
 
         today = date.today().isoformat()
 
+        # Same ETag scheme as /api/entries, plus the date so it turns over at midnight
+        etag = None
+        try:
+            version = supabase.rpc("entries_version", {"uid": user_id}).execute().data
+        except Exception:
+            version = None  # supabase-entries-version.sql not run yet: serve without an ETag
+        if version:
+            etag = '"' + hashlib.blake2b(f"{user_id}:{today}:{version}".encode(), digest_size=8).hexdigest() + '"'
+            if etag in (self.headers.get("If-None-Match") or ""):
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", "private, no-cache")
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.end_headers()
+                return
+
         try:
             result = supabase.table("entries").select("id, entry_number, is_follow_up").eq(
                 "user_id", user_id
@@ -49,15 +70,23 @@ class handler(BaseHTTPRequestHandler):
         entries = result.data or []
         today_count = len(entries)
 
-        result_all = supabase.table("entries").select("date").eq("user_id", user_id).order("date", desc=True).limit(100).execute()
-        all_dates = result_all.data or []
-        unique_days = len(set(r.get("date") for r in all_dates if r.get("date")))
+        try:
+            # Counted in Postgres (supabase-unique-days.sql)
+            unique_days = supabase.rpc("unique_day_count", {"uid": user_id}).execute().data or 0
+        except Exception:
+            result_all = supabase.table("entries").select("date").eq("user_id", user_id).order("date", desc=True).limit(100).execute()
+            unique_days = len(set(r.get("date") for r in (result_all.data or []) if r.get("date")))
 
-        self._send(200, {"count": today_count, "entries": entries, "unique_days": unique_days})
+        self._send(200, {"count": today_count, "entries": entries, "unique_days": unique_days}, etag)
 
-    def _send(self, status, body):
+    def _send(self, status, body, etag=None):
+        payload = orjson.dumps(body)
         self.send_response(status)
         self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "private, no-cache")
         self.send_header("Access-Control-Allow-Origin", "*")
         self.end_headers()
-        self.wfile.write(json.dumps(body).encode("utf-8"))
+        self.wfile.write(payload)
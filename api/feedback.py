@@ -2,22 +2,26 @@
 Vercel serverless: POST /api/feedback — stores user feedback after viewing reports.
 Requires: SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY
 """
-import json
+import functools
 import os
 from http.server import BaseHTTPRequestHandler
 
+import orjson
+from supabase import create_client
 
+from api.security import get_user_id as _get_user_id
+
+
+@functools.lru_cache(maxsize=1)
 def get_supabase():
     url = os.environ.get("SUPABASE_URL", "")
     key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or os.environ.get("SUPABASE_ANON_KEY", "")
     if not url or not key:
         return None
-    from supabase import create_client
     return create_client(url, key)
 
 
 def get_user_id(headers):
-    from api.security import get_user_id as _get_user_id
     return _get_user_id(headers.get("Authorization", ""))
 
 
@@ -29,10 +33,10 @@ class handler(BaseHTTPRequestHandler):
             return
 
         content_len = int(self.headers.get("Content-Length", 0))
-        raw = self.rfile.read(content_len).decode("utf-8") if content_len else "{}"
+        raw = self.rfile.read(content_len) if content_len else b"{}"
         try:
-            data = json.loads(raw)
-        except json.JSONDecodeError:
+            data = orjson.loads(raw)
+        except orjson.JSONDecodeError:
             self._send(400, {"error": "Invalid JSON"})
             return
 
@@ -75,8 +79,10 @@ class handler(BaseHTTPRequestHandler):
         self.end_headers()
 
     def _send(self, status, body):
+        payload = orjson.dumps(body)
         self.send_response(status)
         self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
         self.send_header("Access-Control-Allow-Origin", "*")
         self.end_headers()
-        self.wfile.write(json.dumps(body).encode("utf-8"))
+        self.wfile.write(payload)
@@ -1,12 +1,18 @@
 """
 Vercel serverless function: POST /api/join — stores beta signups in Supabase.
 """
-import json
+import functools
 import os
 
 from http.server import BaseHTTPRequestHandler
 
+import orjson
+from supabase import create_client
 
+from api.security import validate_email
+
+
+@functools.lru_cache(maxsize=1)
 def get_supabase():
     url = os.environ.get("SUPABASE_URL") or os.environ.get("EXPO_PUBLIC_SUPABASE_URL", "")
     key = (
@@ -16,22 +22,22 @@ def get_supabase():
     )
     if not url or not key:
         return None
-    from supabase import create_client
     return create_client(url, key)
 
 
 class handler(BaseHTTPRequestHandler):
     def do_POST(self):
         content_len = int(self.headers.get("Content-Length", 0))
-        raw = self.rfile.read(content_len).decode("utf-8") if content_len else "{}"
+        raw = self.rfile.read(content_len) if content_len else b"{}"
         try:
-            data = json.loads(raw)
-        except json.JSONDecodeError:
+            data = orjson.loads(raw)
+        except orjson.JSONDecodeError:
             self._send(400, {"ok": False, "error": "Invalid JSON"})
             return
 
-        email = (data.get("email") or "").strip().lower()
-        if not email or "@" not in email:
+        # Reject junk locally instead of after a Supabase round trip
+        email = validate_email(data.get("email"))
+        if not email:
             self._send(400, {"ok": False, "error": "Valid email required"})
             return
 
@@ -51,7 +57,9 @@ class handler(BaseHTTPRequestHandler):
                 self._send(500, {"ok": False, "error": "Something went wrong"})
 
     def _send(self, status, body):
+        payload = orjson.dumps(body)
         self.send_response(status)
         self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
         self.end_headers()
-        self.wfile.write(json.dumps(body).encode("utf-8"))
+        self.wfile.write(payload)
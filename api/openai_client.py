@@ -0,0 +1,12 @@
+"""
+Shared OpenAI client for server.py and the Vercel handlers.
+"""
+import functools
+
+import openai
+
+
+@functools.lru_cache(maxsize=4)
+def get_openai(api_key: str) -> openai.OpenAI:
+    """One client per API key, built on first use and reused so calls share the SDK's keep-alive pool."""
+    return openai.OpenAI(api_key=api_key)
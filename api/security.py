@@ -1,9 +1,13 @@
 """
 Security utilities: JWT verification, field encryption, input sanitization.
 """
+import functools
 import os
 import re
+import time
+
 import jwt
+from cryptography.fernet import Fernet
 
 SUPABASE_JWT_SECRET = os.environ.get("SUPABASE_JWT_SECRET", "")
 def _get_encryption_key():
@@ -11,6 +15,18 @@ def _get_encryption_key():
 
 # ── JWT verification ──
 
+_JWT_SECRET_BYTES = SUPABASE_JWT_SECRET.encode("utf-8")
+_JWT_ALGORITHMS = ("HS256",)
+
+
+@functools.lru_cache(maxsize=1024)
+def _decode_verified(token: str) -> dict:
+    """Signature-checked decode, cached per token: a user sends the same JWT until it expires.
+    Raises jwt.InvalidTokenError instead of returning None, so failures aren't cached: a token
+    rejected as not yet valid (iat/nbf a little ahead of our clock) must pass once it is."""
+    return jwt.decode(token, _JWT_SECRET_BYTES, algorithms=_JWT_ALGORITHMS, audience="authenticated")
+
+
 def verify_token(auth_header: str) -> dict | None:
     """Extract and verify user from a Supabase JWT. Returns {"sub": user_id, ...} or None."""
     if not auth_header or not auth_header.startswith("Bearer "):
@@ -24,17 +40,13 @@ def verify_token(auth_header: str) -> dict | None:
         except Exception:
             return None
     try:
-        payload = jwt.decode(
-            token,
-            SUPABASE_JWT_SECRET,
-            algorithms=["HS256"],
-            audience="authenticated",
-        )
-        return payload
-    except jwt.ExpiredSignatureError:
-        return None
+        payload = _decode_verified(token)
     except jwt.InvalidTokenError:
         return None
+    # A cached payload outlives its token, so expiry is re-checked on every hit
+    if payload.get("exp", float("inf")) <= time.time():
+        return None
+    return dict(payload)
 
 
 def get_user_id(auth_header: str) -> str | None:
@@ -47,19 +59,20 @@ def get_user_id(auth_header: str) -> str | None:
 
 # ── Field encryption ──
 
-_fernet = None
-_fernet_key_used = None
+# Fernet tokens are urlsafe base64 of version byte 0x80 + timestamp, so they all start like this
+_FERNET_PREFIX = "gAAAAA"
+
+
+@functools.lru_cache(maxsize=4)
+def _fernet_for(key: str):
+    return Fernet(key.encode())
+
 
 def _get_fernet():
-    global _fernet, _fernet_key_used
     key = _get_encryption_key()
-    if key and (key != _fernet_key_used or _fernet is None):
-        from cryptography.fernet import Fernet
-        _fernet = Fernet(key.encode())
-        _fernet_key_used = key
     if not key:
         return None
-    return _fernet
+    return _fernet_for(key)
 
 
 def encrypt(text: str) -> str:
@@ -74,7 +87,7 @@ def encrypt(text: str) -> str:
 
 def decrypt(text: str) -> str:
     """Decrypt a string. Returns the original if it's not encrypted or no key."""
-    if not text:
+    if not text or not text.startswith(_FERNET_PREFIX):
         return text
     f = _get_fernet()
     if not f:
@@ -121,12 +134,21 @@ def decrypt_int(val, default: int = 0) -> int:
 
 # ── Input sanitization ──
 
+# Headers every JSON handler sets on its responses (server.py adds them in add_security_headers)
+SECURITY_HEADERS = (("X-Content-Type-Options", "nosniff"), ("X-Frame-Options", "DENY"))
+
+# C0 control characters except tab, LF and CR, as a str.translate deletion table
+_CTRL_DELETE = dict.fromkeys([*range(0, 9), 11, 12, *range(14, 32)])
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_UUID_RE = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
 def sanitize_text(text: str, max_length: int = 5000) -> str:
     """Strip control characters and enforce length limit."""
     if not text:
         return ""
     text = text[:max_length]
-    text = re.sub(r"[\x00-\x08\x0b\x0c\x0e-\x1f]", "", text)
+    text = text.translate(_CTRL_DELETE)
     return text.strip()
 
 
@@ -155,7 +177,7 @@ def validate_date(date_str: str) -> str | None:
     """Validate YYYY-MM-DD format. Returns cleaned string or None."""
     if not date_str or not isinstance(date_str, str):
         return None
-    if re.match(r"^\d{4}-\d{2}-\d{2}$", date_str.strip()):
+    if _DATE_RE.match(date_str.strip()):
         return date_str.strip()
     return None
 
@@ -164,6 +186,32 @@ def validate_uuid(uid: str) -> str | None:
     """Validate UUID format."""
     if not uid or not isinstance(uid, str):
         return None
-    if re.match(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$", uid.strip().lower()):
-        return uid.strip().lower()
-    return None
+    s = uid.strip().lower()
+    # Cheap shape check first so junk IDs never reach the regex
+    if len(s) != 36 or s[8] != "-" or s[13] != "-" or s[18] != "-" or s[23] != "-":
+        return None
+    return s if _UUID_RE.match(s) else None
+
+
+def validate_email(email: str) -> str | None:
+    """Validate a plausible user@domain.tld address. Returns it lowercased or None."""
+    if not email or not isinstance(email, str):
+        return None
+    s = email.strip().lower()
+    if len(s) > 254:
+        return None
+    return s if _EMAIL_RE.match(s) else None
+
+
+def parse_checkin(data: dict) -> tuple:
+    """Sanitize a check-in payload in one call.
+    Returns (transcript, sleep_hours, sleep_quality, energy, deep_work_blocks, date); date is None if invalid."""
+    get = data.get
+    return (
+        sanitize_text(get("transcript") or "", max_length=5000),
+        clamp_float(get("sleep_hours", 0), 0, 24, default=0),
+        clamp_int(get("sleep_quality", 3), 1, 5, default=3),
+        clamp_int(get("energy", 3), 1, 5, default=3),
+        clamp_int(get("deep_work_blocks", 0), 0, 5, default=0),
+        validate_date(get("date", "")),
+    )
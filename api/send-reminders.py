@@ -3,34 +3,37 @@ Vercel serverless cron: GET /api/send-reminders
 Runs daily via Vercel Cron to email users who haven't checked in today.
 Requires: SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, RESEND_API_KEY, CRON_SECRET
 """
-import json
+import functools
+import http.client
 import os
+import time
 from datetime import date, timedelta
 from http.server import BaseHTTPRequestHandler
 
+import orjson
+from supabase import create_client
 
+
+@functools.lru_cache(maxsize=1)
 def get_supabase():
     url = os.environ.get("SUPABASE_URL", "")
     key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY", "")
     if not url or not key:
         return None
-    from supabase import create_client
     return create_client(url, key)
 
 
-def send_email(to_email, subject, html_body):
-    import http.client
+# Resend accepts up to 100 messages per /emails/batch request
+RESEND_BATCH_SIZE = 100
+RESEND_FROM = "Signal <noreply@signal-au.com>"
+
+
+def _resend_post(path, payload):
     api_key = os.environ.get("RESEND_API_KEY", "")
     if not api_key:
         raise RuntimeError("RESEND_API_KEY not set")
-    payload = json.dumps({
-        "from": "Signal <noreply@signal-au.com>",
-        "to": [to_email],
-        "subject": subject,
-        "html": html_body,
-    })
     conn = http.client.HTTPSConnection("api.resend.com", timeout=15)
-    conn.request("POST", "/emails", body=payload, headers={
+    conn.request("POST", path, body=orjson.dumps(payload), headers={
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json",
     })
@@ -39,40 +42,31 @@ def send_email(to_email, subject, html_body):
     conn.close()
     if resp.status >= 400:
         raise RuntimeError(f"Resend {resp.status}: {body}")
-    return json.loads(body)
+    return orjson.loads(body)
 
 
-def build_reminder_html(day_number, user_name=""):
-    greeting = f"Hey{' ' + user_name if user_name else ''}"
-    app_url = os.environ.get("APP_URL", "https://signal-au.com")
+def send_email(to_email, subject, html_body):
+    return _resend_post("/emails", {
+        "from": RESEND_FROM,
+        "to": [to_email],
+        "subject": subject,
+        "html": html_body,
+    })
 
-    encouragement = {
-        1: "You signed up — now let's make it count. Your first check-in takes 2 minutes and sets the baseline for everything Signal does for you.",
-        2: "Day 2 — patterns start forming. Keep building the data.",
-        3: "You're almost halfway. The more data, the sharper the insights.",
-        4: "Day 4! Consistency is where Signal gets powerful.",
-        5: "Over the halfway mark. Your weekly report is taking shape.",
-        6: "One more day until your full weekly report unlocks.",
-        7: "Final day of the trial! Complete today to unlock your weekly pattern report.",
-    }
-    msg = encouragement.get(day_number, "Keep the streak going — your data is building something useful.")
 
-    cta_text = "Start your first check-in" if day_number == 1 else "Log today's check-in"
-    subject_line = "Welcome to Signal — start your first check-in" if day_number == 1 else None
+def send_email_batch(messages):
+    """Send [(to_email, subject, html_body), ...] in one request (at most RESEND_BATCH_SIZE)."""
+    return _resend_post("/emails/batch", [
+        {"from": RESEND_FROM, "to": [to_email], "subject": subject, "html": html_body}
+        for to_email, subject, html_body in messages
+    ])
 
-    what_to_expect = ""
-    if day_number == 1:
-        what_to_expect = """
-      <div style="margin:20px 0 0 0;padding:16px;background:rgba(255,255,255,0.03);border:1px solid rgba(255,255,255,0.06);border-radius:10px;">
-        <p style="color:#a3a3a3;font-size:12px;line-height:1.6;margin:0;">
-          <span style="color:#e5e5e5;font-weight:500;">Here's how it works:</span><br>
-          Log 3 things daily — sleep, energy, and a quick reflection.<br>
-          Signal spots patterns you can't see yourself.<br>
-          After 7 days, you unlock your full weekly performance report.
-        </p>
-      </div>"""
 
-    return f"""
+# Stand-in for the greeting name while the cached template is rendered
+_NAME_SLOT = "\x00name\x00"
+
+# Rendered with format_map by _reminder_template
+_HTML_TEMPLATE = """
 <!DOCTYPE html>
 <html>
 <head><meta charset="UTF-8"></head>
@@ -86,12 +80,12 @@ def build_reminder_html(day_number, user_name=""):
     </div>
 
     <div style="background:rgba(255,255,255,0.03);border:1px solid rgba(255,255,255,0.08);border-radius:16px;padding:32px 24px;">
-      <p style="color:#e5e5e5;font-size:15px;margin:0 0 6px 0;">{greeting},</p>
+      <p style="color:#e5e5e5;font-size:15px;margin:0 0 6px 0;">Hey{name_slot},</p>
       <p style="color:#a3a3a3;font-size:14px;line-height:1.6;margin:0 0 20px 0;">
         {msg}
       </p>{what_to_expect}
       <p style="color:#737373;font-size:12px;margin:0 0 24px 0;">
-        Day {day_number} of 7 &nbsp;·&nbsp; {'🟢' * min(day_number - 1, 7)}{'⚫' * max(0, 7 - day_number + 1)}
+        Day {day_number} of 7 &nbsp;·&nbsp; {green_dots}{black_dots}
       </p>
       <div style="text-align:center;">
         <a href="{app_url}/checkin" style="display:inline-block;background:white;color:black;font-size:13px;font-weight:500;padding:10px 28px;border-radius:999px;text-decoration:none;">
@@ -111,6 +105,79 @@ def build_reminder_html(day_number, user_name=""):
 </html>
 """
 
+# "🟢" * k and "⚫" * k for k = 0..8, indexed instead of rebuilt per render
+_GREEN_DOTS = tuple("🟢" * k for k in range(9))
+_BLACK_DOTS = tuple("⚫" * k for k in range(9))
+
+
+def build_reminder_html(day_number, user_name=""):
+    prefix, suffix = _reminder_template(day_number, os.environ.get("APP_URL", "https://signal-au.com"))
+    return f"{prefix}{' ' + user_name if user_name else ''}{suffix}"
+
+
+@functools.lru_cache(maxsize=16)
+def _reminder_template(day_number, app_url):
+    """Render the email once per day number, split where the user's name goes after "Hey"."""
+
+    encouragement = {
+        1: "You signed up — now let's make it count. Your first check-in takes 2 minutes and sets the baseline for everything Signal does for you.",
+        2: "Day 2 — patterns start forming. Keep building the data.",
+        3: "You're almost halfway. The more data, the sharper the insights.",
+        4: "Day 4! Consistency is where Signal gets powerful.",
+        5: "Over the halfway mark. Your weekly report is taking shape.",
+        6: "One more day until your full weekly report unlocks.",
+        7: "Final day of the trial! Complete today to unlock your weekly pattern report.",
+    }
+    msg = encouragement.get(day_number, "Keep the streak going — your data is building something useful.")
+
+    cta_text = "Start your first check-in" if day_number == 1 else "Log today's check-in"
+
+    what_to_expect = ""
+    if day_number == 1:
+        what_to_expect = """
+      <div style="margin:20px 0 0 0;padding:16px;background:rgba(255,255,255,0.03);border:1px solid rgba(255,255,255,0.06);border-radius:10px;">
+        <p style="color:#a3a3a3;font-size:12px;line-height:1.6;margin:0;">
+          <span style="color:#e5e5e5;font-weight:500;">Here's how it works:</span><br>
+          Log 3 things daily — sleep, energy, and a quick reflection.<br>
+          Signal spots patterns you can't see yourself.<br>
+          After 7 days, you unlock your full weekly performance report.
+        </p>
+      </div>"""
+
+    html = _HTML_TEMPLATE.format_map({
+        "name_slot": _NAME_SLOT,
+        "msg": msg,
+        "what_to_expect": what_to_expect,
+        "day_number": day_number,
+        "green_dots": _GREEN_DOTS[min(max(day_number - 1, 0), 7)],
+        "black_dots": _BLACK_DOTS[min(max(0, 7 - day_number + 1), 8)],
+        "cta_text": cta_text,
+        "app_url": app_url,
+    })
+    prefix, _, suffix = html.partition(_NAME_SLOT)
+    return prefix, suffix
+
+
+def reminder_day_counts(supabase, user_ids: list, today: str) -> dict:
+    """{user_id: {"day_count", "checked_in_today"}} for users with entries."""
+    try:
+        # One query for every user (supabase-reminder-stats.sql)
+        counts = supabase.rpc("reminder_day_counts", {"p_user_ids": user_ids, "p_today": today}).execute()
+        return {str(r["user_id"]): r for r in (counts.data or [])}
+    except Exception:
+        pass
+    # Function not created yet: one query per user, as before
+    by_user = {}
+    for user_id in user_ids:
+        try:
+            result = supabase.table("entries").select("date").eq("user_id", user_id).order("date", desc=True).limit(30).execute()
+        except Exception:
+            continue
+        dates = {e.get("date") for e in (result.data or []) if e.get("date")}
+        if dates:
+            by_user[str(user_id)] = {"day_count": len(dates), "checked_in_today": today in dates}
+    return by_user
+
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
@@ -138,9 +205,13 @@ class handler(BaseHTTPRequestHandler):
             self._send(500, {"error": f"Failed to list users: {e}"})
             return
 
+        user_ids = [u.id if hasattr(u, 'id') else u.get('id') for u in users]
+        by_user = reminder_day_counts(supabase, [uid for uid in user_ids if uid], today)
+
         sent = 0
         skipped = 0
         errors = []
+        outbox = []
 
         for user in users:
             user_id = user.id if hasattr(user, 'id') else user.get('id')
@@ -148,24 +219,12 @@ class handler(BaseHTTPRequestHandler):
             if not user_id or not email:
                 continue
 
-            created_at = user.created_at if hasattr(user, 'created_at') else user.get('created_at', '')
-            created_str = str(created_at)[:10] if created_at else ''
-
-            try:
-                result = supabase.table("entries").select("id, date").eq(
-                    "user_id", user_id
-                ).order("date", desc=True).limit(30).execute()
-                entries = result.data or []
-            except Exception:
-                entries = []
-
-            already_today = any(e.get("date") == today for e in entries)
-            if already_today:
+            stats = by_user.get(str(user_id)) or {}
+            if stats.get("checked_in_today"):
                 skipped += 1
                 continue
 
-            unique_dates = set(e.get("date") for e in entries if e.get("date"))
-            day_number = len(unique_dates) + 1
+            day_number = (stats.get("day_count") or 0) + 1
 
             if day_number > 7:
                 skipped += 1
@@ -176,21 +235,24 @@ class handler(BaseHTTPRequestHandler):
             if meta:
                 user_name = meta.get("full_name", "") or meta.get("name", "")
                 if user_name:
-                    user_name = user_name.split()[0]
+                    user_name = user_name.strip().partition(" ")[0]
+
+            if day_number == 1:
+                subject = "Welcome to Signal — start your first check-in"
+            else:
+                subject = f"Day {day_number}/7 — Time for your check-in"
+            outbox.append((email, subject, build_reminder_html(day_number, user_name)))
 
+        # One Resend call per 100 reminders instead of one call (and a 1s pause) per user
+        for i in range(0, len(outbox), RESEND_BATCH_SIZE):
+            batch = outbox[i:i + RESEND_BATCH_SIZE]
             try:
-                if sent > 0:
-                    import time
+                if i > 0:
                     time.sleep(1)
-                if day_number == 1:
-                    subject = "Welcome to Signal — start your first check-in"
-                else:
-                    subject = f"Day {day_number}/7 — Time for your check-in"
-                html = build_reminder_html(day_number, user_name)
-                send_email(email, subject, html)
-                sent += 1
+                send_email_batch(batch)
+                sent += len(batch)
             except Exception as e:
-                errors.append(f"{email}: {e}")
+                errors.extend(f"{email}: {e}" for email, _, _ in batch)
 
         self._send(200, {
             "ok": True,
@@ -200,7 +262,9 @@ class handler(BaseHTTPRequestHandler):
         })
 
     def _send(self, status, body):
+        payload = orjson.dumps(body)
         self.send_response(status)
         self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
         self.end_headers()
-        self.wfile.write(json.dumps(body).encode("utf-8"))
+        self.wfile.write(payload)
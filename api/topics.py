@@ -0,0 +1,48 @@
+"""
+Keyword heuristics for the three reflection topics (sleep, feeling, attempt).
+Used as the GPT fallback and to skip GPT calls when a reflection clearly covers everything.
+"""
+import re
+
+TOPIC_QUESTIONS = ["How did you sleep?", "What are you feeling?", "What did you attempt?"]
+
+_SLEEP, _FEEL, _ATTEMPT = 1, 2, 4
+_ALL_TOPICS = _SLEEP | _FEEL | _ATTEMPT
+_TOPIC_WORDS = (
+    (_SLEEP, "sleep slept rest woke nap bed insomnia alright well hour hours asleep restorative restless"),
+    (_FEEL, "feel felt feeling energy mood stressed anxious happy sad tired exhausted drained bothered "
+            "down low great calm relaxed motivated restless groggy heavy"),
+    (_ATTEMPT, "work worked attempt tried did task project focus study meeting class productive "
+               "unproductive nothing read exercise chilled"),
+)
+# word -> bitmask of the topics it counts toward ("restless" is both sleep and feeling)
+_TOPIC_MASKS = {}
+for _bit, _words in _TOPIC_WORDS:
+    for _w in _words.split():
+        _TOPIC_MASKS[_w] = _TOPIC_MASKS.get(_w, 0) | _bit
+# All keywords in one alternation, longest first so "unproductive" isn't cut short
+_TOPIC_RE = re.compile(r"\b(?:" + "|".join(sorted(_TOPIC_MASKS, key=len, reverse=True)) + r")\b")
+_FEEL_PHRASE_RE = re.compile(r"(feel|i'm|im)\s+(okay|fine|good|bad)")
+
+
+def _topics_seen(t_lower: str) -> int:
+    """Bitmask of the topics already-lowercased text mentions, from one scan."""
+    seen = 0
+    for m in _TOPIC_RE.finditer(t_lower):
+        seen |= _TOPIC_MASKS[m.group()]
+        if seen == _ALL_TOPICS:
+            return seen
+    if not seen & _FEEL and _FEEL_PHRASE_RE.search(t_lower):
+        seen |= _FEEL
+    return seen
+
+
+def fallback_check_topics(text: str) -> list:
+    """Return the topic questions the text doesn't touch on."""
+    seen = _topics_seen(text.lower())
+    return [q for bit, q in zip((_SLEEP, _FEEL, _ATTEMPT), TOPIC_QUESTIONS) if not seen & bit]
+
+
+def topics_covered(t_lower: str) -> bool:
+    """True if already-lowercased text mentions sleep, a feeling and an activity."""
+    return _topics_seen(t_lower) == _ALL_TOPICS
@@ -2,20 +2,46 @@
 Vercel serverless: POST /api/transcribe — Whisper speech-to-text.
 Requires: OPENAI_API_KEY
 """
-import json
 import os
-import tempfile
 from http.server import BaseHTTPRequestHandler
 
+import orjson
+
+from api.openai_client import get_openai
+from api.security import SECURITY_HEADERS, get_user_id
+
 OPENAI_KEY = (os.environ.get("OPENAI_API_KEY") or os.environ.get("OPENAI_KEY") or "").strip()
 
 
 MAX_AUDIO_SIZE = 25 * 1024 * 1024  # 25MB limit
+MAX_BODY_SIZE = MAX_AUDIO_SIZE + 64 * 1024  # audio plus multipart headers/boundaries
+
+
+def extract_audio(raw: bytes, boundary: bytes) -> bytes | None:
+    """Return the body of the multipart file part that looks like audio.
+    Scans for boundaries in place and slices once, instead of splitting the whole upload."""
+    delim = b"--" + boundary
+    # A part's body ends at the CRLF that precedes the next delimiter
+    sep = b"\r\n" + delim
+    pos = raw.find(delim)
+    while pos >= 0:
+        head_start = pos + len(delim)
+        head_end = raw.find(b"\r\n\r\n", head_start)
+        if head_end < 0:
+            return None
+        body_start = head_end + 4
+        nxt = raw.find(sep, body_start)
+        headers = raw[head_start:head_end]
+        if b"audio" in headers and b"filename=" in headers:
+            return raw[body_start:nxt if nxt >= 0 else len(raw)]
+        if nxt < 0:
+            return None
+        pos = nxt + 2
+    return None
 
 
 class handler(BaseHTTPRequestHandler):
     def do_POST(self):
-        from api.security import get_user_id
         user_id = get_user_id(self.headers.get("Authorization", ""))
         if not user_id:
             self._send(401, {"error": "Authentication required"})
@@ -30,17 +56,14 @@ class handler(BaseHTTPRequestHandler):
         if content_len == 0:
             self._send(400, {"error": "No body"})
             return
+        if content_len > MAX_BODY_SIZE:
+            # Refuse before reading, so an oversized upload is never buffered in memory
+            self._send(400, {"error": "Audio file too large (max 25MB)"})
+            return
 
         raw = self.rfile.read(content_len)
         boundary = content_type.split("boundary=")[-1].strip().strip('"')
-        parts = raw.split(b"--" + boundary.encode())
-        audio_data = None
-        for p in parts:
-            if b"audio" in p and b"filename=" in p:
-                idx = p.find(b"\r\n\r\n")
-                if idx >= 0:
-                    audio_data = p[idx + 4 :].rstrip(b"\r\n")
-                    break
+        audio_data = extract_audio(raw, boundary.encode())
 
         if not audio_data:
             self._send(400, {"error": "No audio file in request"})
@@ -55,10 +78,6 @@ class handler(BaseHTTPRequestHandler):
             return
 
         try:
-            import openai
-            with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as f:
-                f.write(audio_data)
-                path = f.name
             prompt = (
                 "Daily journal check-in about sleep quality, energy levels, deep work, "
                 "focus, productivity, mood, stress, anxiety, motivation, exhaustion, "
@@ -66,19 +85,20 @@ class handler(BaseHTTPRequestHandler):
                 "screen time, hydration, napping, burnout, migraine, headache, workout, "
                 "meditation, vibe coding, FaceTiming."
             )
-            with open(path, "rb") as f:
-                r = openai.OpenAI(api_key=OPENAI_KEY).audio.transcriptions.create(
-                    model="whisper-1", file=f, language="en", prompt=prompt,
-                )
-            os.unlink(path)
+            # Upload straight from memory; the filename tells Whisper the container format
+            r = get_openai(OPENAI_KEY).audio.transcriptions.create(
+                model="whisper-1", file=("audio.webm", audio_data), language="en", prompt=prompt,
+            )
             self._send(200, {"transcript": r.text})
         except Exception as e:
             self._send(500, {"error": str(e), "transcript": ""})
 
     def _send(self, status, body):
+        payload = orjson.dumps(body)
         self.send_response(status)
         self.send_header("Content-type", "application/json")
-        self.send_header("X-Content-Type-Options", "nosniff")
-        self.send_header("X-Frame-Options", "DENY")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in SECURITY_HEADERS:
+            self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(json.dumps(body).encode("utf-8"))
+        self.wfile.write(payload)
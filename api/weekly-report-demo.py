@@ -3,17 +3,15 @@ Vercel serverless: POST /api/weekly-report-demo — Demo weekly report (no auth)
 Returns GPT-generated report from 7 days of test reflections.
 Requires: OPENAI_API_KEY
 """
-import importlib.util
-import json
-import os
+import importlib
 from http.server import BaseHTTPRequestHandler
 
+import orjson
+
+from api.security import SECURITY_HEADERS
+
 # Load weekly-report module (filename has hyphen)
-_mod_path = os.path.join(os.path.dirname(__file__), "weekly-report.py")
-_spec = importlib.util.spec_from_file_location("weekly_report", _mod_path)
-_weekly_report = importlib.util.module_from_spec(_spec)
-_spec.loader.exec_module(_weekly_report)
-generate_weekly_report = _weekly_report.generate_weekly_report
+generate_weekly_report = importlib.import_module("api.weekly-report").generate_weekly_report
 
 DEMO_ENTRIES = [
     {"date": "2026-02-17", "sleep_hours": 6, "sleep_quality": 2, "energy": 2, "deep_work_blocks": 0,
@@ -50,9 +48,11 @@ class handler(BaseHTTPRequestHandler):
         self._send(200, report)
 
     def _send(self, status, body):
+        payload = orjson.dumps(body)
         self.send_response(status)
         self.send_header("Content-type", "application/json")
-        self.send_header("X-Content-Type-Options", "nosniff")
-        self.send_header("X-Frame-Options", "DENY")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in SECURITY_HEADERS:
+            self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(json.dumps(body).encode("utf-8"))
+        self.wfile.write(payload)
@@ -2,60 +2,153 @@
 Vercel serverless: POST /api/weekly-report — GPT weekly synthesis from 7+ entries.
 Requires: OPENAI_API_KEY, SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY
 """
-import json
+import functools
+import hashlib
 import os
-import re
+import sys
 from http.server import BaseHTTPRequestHandler
 
+import orjson
+from supabase import create_client
+
+from api.openai_client import get_openai
+from api.security import SECURITY_HEADERS, decrypt, encrypt, get_user_id
+
 SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
 SUPABASE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or os.environ.get("SUPABASE_ANON_KEY", "")
-OPENAI_KEY = os.environ.get("OPENAI_API_KEY", "")
+OPENAI_KEY = (os.environ.get("OPENAI_API_KEY") or "").strip()
+
+# Strict JSON schema for the weekly report, so the reply parses as-is. metrics
+# isn't in it: those numbers are computed here, not by the model.
+_STR = {"type": "string"}
+_STR_LIST = {"type": "array", "items": _STR}
+WEEKLY_REPORT_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "weekly_report",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "week_narrative": _STR,
+                "recurring_patterns": _STR_LIST,
+                "recovery_lag": {"type": ["string", "null"]},
+                "top_derailers": _STR_LIST,
+                "bright_spots": _STR_LIST,
+                "weekly_experiment": {
+                    "type": "object",
+                    "properties": {"focus": _STR, "protocol": _STR, "mechanism": _STR, "success_metric": _STR},
+                    "required": ["focus", "protocol", "mechanism", "success_metric"],
+                    "additionalProperties": False,
+                },
+                "micro_shifts": _STR_LIST,
+            },
+            "required": [
+                "week_narrative", "recurring_patterns", "recovery_lag", "top_derailers",
+                "bright_spots", "weekly_experiment", "micro_shifts",
+            ],
+            "additionalProperties": False,
+        },
+    },
+}
 
 
+@functools.lru_cache(maxsize=1)
 def get_supabase():
     if not SUPABASE_URL or not SUPABASE_KEY:
         return None
-    from supabase import create_client
     return create_client(SUPABASE_URL, SUPABASE_KEY)
 
 
-def build_entries_digest(entries: list) -> str:
-    lines = []
+_DIGEST_HEADER = "date|sleep_h|sleep_q|energy|deep_work|summary|drivers|experiment"
+# Keeps each entry on one row of the pipe-delimited digest
+_DIGEST_CELL = str.maketrans({"|": "/", "\n": " ", "\r": " "})
+
+
+def build_entries_digest(entries: list) -> tuple:
+    """Return (digest, sleep sum, quality sum, energy sum, deep work sum) from one pass over entries.
+    The digest is one pipe-delimited row per entry under _DIGEST_HEADER."""
+    lines = [_DIGEST_HEADER]
+    s_sleep = s_quality = s_energy = s_blocks = 0
     for e in entries:
+        s_sleep += e.get("sleep_hours", 0) or 0
+        s_quality += e.get("sleep_quality", 3) or 3
+        s_energy += e.get("energy", 3) or 3
+        s_blocks += e.get("deep_work_blocks", 0) or 0
         drivers = e.get("likely_drivers") or []
         if isinstance(drivers, list):
             drivers = "; ".join(str(d) for d in drivers)
+        summary = (e.get("reflection_summary") or "—")[:300].translate(_DIGEST_CELL)
+        experiment = (e.get("experiment_for_tomorrow") or "—")[:150].translate(_DIGEST_CELL)
         lines.append(
-            f"Date: {e.get('date')} | Sleep: {e.get('sleep_hours')}h (quality {e.get('sleep_quality')}/5) | "
-            f"Energy: {e.get('energy')}/5 | Deep work: {e.get('deep_work_blocks')} blocks\n"
-            f"Summary: {(e.get('reflection_summary') or '—')[:300]}\n"
-            f"Drivers: {drivers[:200]}\n"
-            f"Experiment: {(e.get('experiment_for_tomorrow') or '—')[:150]}"
+            f"{e.get('date')}|{e.get('sleep_hours')}|{e.get('sleep_quality')}|{e.get('energy')}|"
+            f"{e.get('deep_work_blocks')}|{summary}|{drivers[:200].translate(_DIGEST_CELL)}|{experiment}"
         )
-    return "\n---\n".join(lines)
+    return "\n".join(lines), s_sleep, s_quality, s_energy, s_blocks
 
 
-def generate_weekly_report(entries: list, api_key: str = None) -> dict:
-    key = (api_key or OPENAI_KEY or "").strip()
-    if not key:
-        return {"error": "OPENAI_API_KEY not set"}
+# Columns the digest and the report charts read; transcripts stay in the database
+REPORT_COLUMNS = "date, sleep_hours, sleep_quality, energy, deep_work_blocks, reflection_summary, likely_drivers, experiment_for_tomorrow"
 
-    digest = build_entries_digest(entries)
-    n = len(entries)
-    avg_sleep = round(sum(e.get("sleep_hours", 0) or 0 for e in entries) / n, 1)
-    avg_quality = round(sum(e.get("sleep_quality", 3) or 3 for e in entries) / n, 1)
-    avg_energy = round(sum(e.get("energy", 3) or 3 for e in entries) / n, 1)
-    total_blocks = sum(e.get("deep_work_blocks", 0) or 0 for e in entries)
 
-    prompt = f"""You are "Signal", a cognitive performance analysis engine. Synthesize {n} daily reflections into a weekly performance report.
+def first_entry_per_date(entries: list) -> dict:
+    """Map each date to its first entry (entry_number 1, else the first one seen)."""
+    by_date = {}
+    for e in entries:
+        d = e.get("date")
+        if d and (d not in by_date or e.get("entry_number") == 1):
+            by_date[d] = e
+    return by_date
+
+
+def fetch_recent_entries(supabase, user_id: str, n: int = 14) -> list:
+    """The user's first entry on each of their n most recent dates, newest first."""
+    try:
+        # Dedup and limit in Postgres (supabase-recent-entries.sql)
+        return supabase.rpc("get_recent_entries", {"uid": user_id, "n": n}).execute().data or []
+    except Exception:
+        pass
+    try:
+        result = supabase.table("entries").select(REPORT_COLUMNS + ", entry_number").eq("user_id", user_id).order("date", desc=True).limit(30).execute()
+    except Exception:
+        # entry_number only exists after supabase-multi-entries.sql
+        result = supabase.table("entries").select(REPORT_COLUMNS).eq("user_id", user_id).order("date", desc=True).limit(30).execute()
+    by_date = first_entry_per_date(result.data or [])
+    return [by_date[d] for d in sorted(by_date, reverse=True)[:n]]
+
+
+# Bump when the prompt or schema changes so cached reports are regenerated
+REPORT_CACHE_VERSION = 2
 
-WEEKLY DATA:
-- Entries: {n} days
-- Avg sleep: {avg_sleep}h | Avg quality: {avg_quality}/5 | Avg energy: {avg_energy}/5
-- Total deep work blocks: {total_blocks}
 
-DAILY ENTRIES:
-{digest[:6000]}
+def report_cache_key(entries: list) -> str:
+    """Hash of the rows a report is built from, taken before decrypting (stored ciphertext only changes with the row)."""
+    return hashlib.blake2b(orjson.dumps([REPORT_CACHE_VERSION, entries]), digest_size=16).hexdigest()
+
+
+def load_cached_report(supabase, user_id: str, cache_key: str) -> dict | None:
+    """A previously generated report for exactly these entries (supabase-weekly-reports.sql), or None."""
+    try:
+        rows = supabase.table("weekly_reports").select("report").eq("user_id", user_id).eq("digest_hash", cache_key).limit(1).execute().data
+        return orjson.loads(decrypt(rows[0]["report"])) if rows else None
+    except Exception:
+        return None  # table not created yet, or an unreadable row: regenerate
+
+
+def save_cached_report(supabase, user_id: str, cache_key: str, report: dict):
+    try:
+        supabase.table("weekly_reports").upsert(
+            {"user_id": user_id, "digest_hash": cache_key, "report": encrypt(orjson.dumps(report).decode("utf-8"))},
+            on_conflict="user_id,digest_hash",
+            ignore_duplicates=True,
+        ).execute()
+    except Exception as e:
+        print(f"[weekly-report] cache write failed: {type(e).__name__}: {e}", file=sys.stderr)
+
+
+# Static instructions, sent as the system message ahead of the per-user data so
+# the prompt prefix is identical on every call (and eligible for OpenAI prompt caching)
+_REPORT_INSTRUCTIONS = """You are "Signal", a cognitive performance analysis engine. Synthesize the user's daily reflections into a weekly performance report.
 
 RULES:
 1. QUANTIFY everything. Never say "sleep impacted productivity." Instead: "When sleep quality was ≥4/5, deep work output doubled (2 blocks vs 0–1 on low-sleep days)." Cite exact numbers and thresholds.
@@ -64,111 +157,70 @@ RULES:
 4. Tone: Analytical, precise, non-emotional. Signal must feel like insight, not generic advice.
 5. For each pattern, assign confidence: Strong correlation (clear cause→effect across 3+ days), Moderate (2 days or partial), Emerging (1–2 instances, worth watching).
 
-Return valid JSON only. No markdown. Structure:
-{{
-  "week_narrative": "3-5 sentence overview. Cite specific dates and inflection points. Include recovery lag if visible (e.g., 'Sleep deprivation showed a 24-hour recovery window before output normalized').",
-  "metrics": {{
-    "avg_sleep": {avg_sleep},
-    "avg_sleep_quality": {avg_quality},
-    "avg_energy": {avg_energy},
-    "total_deep_work": {total_blocks},
-    "entries_count": {n}
-  }},
-  "recurring_patterns": [
-    "[Strong correlation] When sleep quality ≥4/5, deep work doubled (2 blocks vs 0–1). Feb 19, 22.",
-    "[Moderate correlation] Phone restriction → output. Evidence: Feb 19, 22.",
-    "[Emerging] Post-lunch crashes on Feb 18, 20 — worth tracking."
-  ],
-  "recovery_lag": "Optional: How long did poor sleep/stress affect output? e.g., '24-hour recovery window' or '48-hour lag before energy normalized'. Omit if not discernible.",
-  "top_derailers": [
-    "Derailer with numbers: e.g., 'Sleep <6h on Feb 17, 20 → 0 deep work blocks both days vs 2 blocks when ≥7h'",
-    "Second derailer with specific days and quantified impact"
-  ],
-  "bright_spots": [
-    "Quantified: e.g., 'Feb 22: 7.5h sleep, 4/5 quality → 2 deep work blocks, highest energy day'"
-  ],
-  "weekly_experiment": {{
-    "focus": "The ONE thing to focus on based on strongest quantified pattern",
-    "protocol": "Specific daily action with timing and measurement",
-    "mechanism": "Why this targets the root cause",
-    "success_metric": "Quantified: e.g., '4/5 sleep quality on 5 of 7 days' or '2+ deep work blocks on 4 days'"
-  }},
-  "micro_shifts": [
-    "2-3 small daily adjustments that support the main experiment"
-  ]
-}}"""
+FIELDS:
+- week_narrative: 3-5 sentence overview. Cite specific dates and inflection points, and recovery lag if visible.
+- recurring_patterns: prefixed with confidence, e.g. "[Strong correlation] When sleep quality ≥4/5, deep work doubled (2 blocks vs 0–1). Feb 19, 22."
+- recovery_lag: how long poor sleep/stress affected output, e.g. "24-hour recovery window"; null if not discernible.
+- top_derailers: with days and numbers, e.g. "Sleep <6h on Feb 17, 20 → 0 deep work blocks both days vs 2 blocks when ≥7h".
+- bright_spots: quantified, e.g. "Feb 22: 7.5h sleep, 4/5 quality → 2 deep work blocks, highest energy day".
+- weekly_experiment: focus (the ONE thing, from the strongest pattern), protocol (daily action with timing and measurement), mechanism (why it targets the root cause), success_metric (quantified, e.g. "2+ deep work blocks on 4 days").
+- micro_shifts: 2-3 small daily adjustments that support the experiment."""
+
+
+def generate_weekly_report(entries: list, api_key: str = None) -> dict:
+    key = api_key.strip() if api_key else OPENAI_KEY
+    if not key:
+        return {"error": "OPENAI_API_KEY not set"}
+
+    digest, s_sleep, s_quality, s_energy, total_blocks = build_entries_digest(entries)
+    n = len(entries)
+    avg_sleep = round(s_sleep / n, 1)
+    avg_quality = round(s_quality / n, 1)
+    avg_energy = round(s_energy / n, 1)
+    metrics = {
+        "avg_sleep": avg_sleep,
+        "avg_sleep_quality": avg_quality,
+        "avg_energy": avg_energy,
+        "total_deep_work": total_blocks,
+        "entries_count": n,
+    }
+
+    prompt = f"""WEEKLY DATA:
+- Entries: {n} days
+- Avg sleep: {avg_sleep}h | Avg quality: {avg_quality}/5 | Avg energy: {avg_energy}/5
+- Total deep work blocks: {total_blocks}
+
+DAILY ENTRIES (sleep_q and energy are 1–5, deep_work is blocks):
+{digest[:6000]}"""
 
     try:
-        import openai
-        client = openai.OpenAI(api_key=key)
+        client = get_openai(key)
         r = client.chat.completions.create(
             model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
+            messages=[
+                {"role": "system", "content": _REPORT_INSTRUCTIONS},
+                {"role": "user", "content": prompt},
+            ],
             temperature=0.3,
             max_tokens=3000,
+            response_format=WEEKLY_REPORT_RESPONSE_FORMAT,
         )
-        text = (r.choices[0].message.content or "").strip()
+        text = r.choices[0].message.content
         if not text:
             raise ValueError("Empty response from GPT")
-        if text.startswith("```"):
-            text = text.split("```")[1]
-            if text.lower().startswith("json"):
-                text = text[4:]
-            text = text.strip()
-        start = text.find("{")
-        end = text.rfind("}") + 1
-        if start >= 0 and end > start:
-            text = text[start:end]
-        text = re.sub(r",\s*}", "}", text)
-        text = re.sub(r",\s*]", "]", text)
-        data = json.loads(text)
-
-        # Normalize any dict fields to strings
-        for field in ("week_narrative",):
-            if isinstance(data.get(field), dict):
-                data[field] = "\n".join(f"{k}: {v}" for k, v in data[field].items())
-
-        for list_field in ("recurring_patterns", "top_derailers", "bright_spots", "micro_shifts"):
-            items = data.get(list_field, [])
-            if isinstance(items, list):
-                data[list_field] = [
-                    " — ".join(f"{k}: {v}" for k, v in d.items()) if isinstance(d, dict) else str(d)
-                    for d in items
-                ]
-
-        exp = data.get("weekly_experiment")
-        if isinstance(exp, dict):
-            data["weekly_experiment"] = exp
-        elif isinstance(exp, str):
-            data["weekly_experiment"] = {"focus": exp, "protocol": "", "mechanism": "", "success_metric": ""}
-
-        data.setdefault("metrics", {
-            "avg_sleep": avg_sleep,
-            "avg_sleep_quality": avg_quality,
-            "avg_energy": avg_energy,
-            "total_deep_work": total_blocks,
-            "entries_count": n,
-        })
-
+        data = orjson.loads(text)
+        data["metrics"] = metrics
         return data
     except Exception as e:
-        import sys
         print(f"[weekly-report] GPT failed: {type(e).__name__}: {e}", file=sys.stderr)
         return {
             "error": f"Report generation failed: {type(e).__name__}: {e}",
-            "metrics": {
-                "avg_sleep": avg_sleep,
-                "avg_sleep_quality": avg_quality,
-                "avg_energy": avg_energy,
-                "total_deep_work": total_blocks,
-                "entries_count": n,
-            },
+            "metrics": metrics,
         }
 
 
 class handler(BaseHTTPRequestHandler):
     def _get_user_id(self):
-        from api.security import get_user_id
         return get_user_id(self.headers.get("Authorization", ""))
 
     def do_POST(self):
@@ -178,10 +230,10 @@ class handler(BaseHTTPRequestHandler):
             return
 
         content_len = int(self.headers.get("Content-Length", 0))
-        raw = self.rfile.read(content_len).decode("utf-8") if content_len else "{}"
+        raw = self.rfile.read(content_len) if content_len else b"{}"
         try:
-            data = json.loads(raw)
-        except json.JSONDecodeError:
+            data = orjson.loads(raw)
+        except orjson.JSONDecodeError:
             self._send(400, {"error": "Invalid JSON"})
             return
 
@@ -190,40 +242,39 @@ class handler(BaseHTTPRequestHandler):
             self._send(503, {"error": "Server not configured"})
             return
 
-        result = supabase.table("entries").select("*").eq("user_id", user_id).order("date", desc=True).limit(30).execute()
-        entries = result.data or []
+        # One entry per date, so same-day follow-ups don't crowd real days out of the prompt
+        recent = fetch_recent_entries(supabase, user_id)
+        entries_count = len(recent)
+        if entries_count < 7:
+            self._send(200, {"locked": True, "entries_count": entries_count, "needed": 7})
+            return
 
-        from api.security import decrypt
-        for entry in entries:
-            entry["transcript"] = decrypt(entry.get("transcript") or "")
+        cache_key = report_cache_key(recent)
+        # Decrypt only the entries that are actually used
+        for entry in recent:
             entry["reflection_summary"] = decrypt(entry.get("reflection_summary") or "")
-            entry["predicted_impact"] = decrypt(entry.get("predicted_impact") or "")
             entry["experiment_for_tomorrow"] = decrypt(entry.get("experiment_for_tomorrow") or "")
             entry["likely_drivers"] = [decrypt(d) for d in (entry.get("likely_drivers") or [])]
 
-        unique_dates = set(e.get("date") for e in entries if e.get("date"))
-        entries_count = len(unique_dates)
-        if entries_count < 7:
-            self._send(200, {"locked": True, "entries_count": entries_count, "needed": 7})
-            return
-
-        report = generate_weekly_report(entries[:14], api_key=OPENAI_KEY)
-        if report.get("error") and not report.get("week_narrative"):
-            self._send(503, report)
-            return
+        # Same entries as last time: reuse that report instead of calling GPT again
+        report = load_cached_report(supabase, user_id, cache_key)
+        if report is None:
+            report = generate_weekly_report(recent, api_key=OPENAI_KEY)
+            if report.get("error") and not report.get("week_narrative"):
+                self._send(503, report)
+                return
+            if not report.get("error"):
+                save_cached_report(supabase, user_id, cache_key, report)
 
-        by_date = {}
-        for e in entries[:14]:
-            d = e.get("date")
-            if d and (d not in by_date or e.get("entry_number") == 1):
-                by_date[d] = e
-        report["entries"] = [by_date[d] for d in sorted(by_date.keys())]
+        report["entries"] = recent[::-1]
         self._send(200, report)
 
     def _send(self, status, body):
+        payload = orjson.dumps(body)
         self.send_response(status)
         self.send_header("Content-type", "application/json")
-        self.send_header("X-Content-Type-Options", "nosniff")
-        self.send_header("X-Frame-Options", "DENY")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in SECURITY_HEADERS:
+            self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(json.dumps(body).encode("utf-8"))
+        self.wfile.write(payload)
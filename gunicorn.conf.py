@@ -0,0 +1,21 @@
+"""
+Gunicorn settings for `gunicorn server:app` (Render). Picked up automatically from the working directory.
+The default is one sync worker, which serializes every request behind multi-second OpenAI calls;
+threaded workers let those I/O waits overlap.
+"""
+import os
+
+worker_class = "gthread"
+# One process by default: the rate limiter, GPT/entries caches and schema probe are per process,
+# so N workers would mean N times the per-user rate limit and 1/N the cache hits.
+# The work is almost all waiting on OpenAI/Supabase, so threads carry the concurrency.
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 16))
+# GPT reports and Whisper uploads can take well over gunicorn's 30s default
+timeout = 120
+
+
+def post_worker_init(worker):
+    # Open each worker's OpenAI/Supabase connections before its first request
+    from server import start_warm_up
+    start_warm_up()
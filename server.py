@@ -3,10 +3,10 @@ Signal local dev server: serves all pages + API routes.
 Set env: SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY (or SUPABASE_ANON_KEY), OPENAI_API_KEY (optional).
 Run: python server.py  →  http://127.0.0.1:5000/
 """
-import json
+import gzip
 import os
 import re
-import tempfile
+from datetime import date
 
 try:
     from dotenv import load_dotenv
@@ -16,19 +16,70 @@ try:
 except ImportError:
     pass
 
+import orjson
 from flask import Flask, request, jsonify, send_from_directory, Response
-from functools import wraps
+from flask.json.provider import JSONProvider
+from functools import lru_cache, wraps
 
 # Import API logic from Vercel functions
 from api.analyze import get_supabase, get_supabase_for_user, analyze_with_gpt
+from api.clarify import clarify_messages, fallback_clarify, strip_code_fence
+from api.cache import LRUCache, text_key
+from api.openai_client import get_openai
+from api.topics import TOPIC_QUESTIONS, fallback_check_topics
 from api.security import (
     get_user_id, encrypt, decrypt, encrypt_value, decrypt_float, decrypt_int,
-    sanitize_text, clamp_int, clamp_float, validate_date, validate_uuid,
+    sanitize_text, validate_email, validate_uuid, parse_checkin,
 )
 import importlib
 weekly_report_mod = importlib.import_module("api.weekly-report")
+# Demo report data lives with the Vercel demo handler (7 days of test reflections)
+DEMO_ENTRIES = importlib.import_module("api.weekly-report-demo").DEMO_ENTRIES
 
-app = Flask(__name__, static_folder=".", static_url_path="")
+# No built-in static route: it would serve every file under the project root (server.py, .env)
+# ahead of serve_static's extension allowlist
+app = Flask(__name__, static_folder=None)
+
+
+class OrjsonProvider(JSONProvider):
+    """jsonify() and request.get_json() through orjson, matching the api/ handlers."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # orjson already returns bytes; skip the str round trip in JSONProvider.response
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype="application/json")
+
+
+app.json = OrjsonProvider(app)
+# Whisper's 25MB audio limit plus multipart overhead; Werkzeug answers 413 past this before parsing
+app.config["MAX_CONTENT_LENGTH"] = 26 * 1024 * 1024
+# Every other route takes a small JSON body, so get_json() never parses megabytes of text
+MAX_JSON_BODY = 64 * 1024
+
+
+# ── CORS preflight ──
+
+@app.before_request
+def cors_preflight():
+    """Answer every /api/ preflight here, before routing and require_auth (preflights carry no token)."""
+    if request.method == "OPTIONS" and request.path.startswith("/api/"):
+        r = Response("", 204)
+        r.headers["Access-Control-Allow-Origin"] = "*"
+        r.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+        r.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization"
+        return r
+
+
+@app.before_request
+def limit_body_size():
+    if request.path != "/api/transcribe" and (request.content_length or 0) > MAX_JSON_BODY:
+        return jsonify({"error": "Request body too large"}), 413
 
 
 # ── Security headers ──
@@ -45,20 +96,53 @@ def add_security_headers(response):
 
 # ── Rate limiting (simple in-memory) ──
 
-from collections import defaultdict
+import threading
 import time
-
-_rate_limits = defaultdict(list)
+from collections import OrderedDict
+
+# Token bucket per key: (tokens, last refill). RATE_LIMIT_MAX requests can burst,
+# then tokens refill at RATE_LIMIT_MAX per RATE_LIMIT_WINDOW seconds.
+# Ordered by last use: a bucket idle for a whole window is full again, the same as
+# a missing one, so those are dropped from the front and memory tracks active users.
+_buckets = OrderedDict()
+_buckets_lock = threading.Lock()
 RATE_LIMIT_WINDOW = 60
-RATE_LIMIT_MAX = 30
+RATE_LIMIT_MAX = 30  # per process: with WEB_CONCURRENCY > 1 each gunicorn worker allows this many
 
 def check_rate_limit(key: str) -> bool:
-    now = time.time()
-    _rate_limits[key] = [t for t in _rate_limits[key] if now - t < RATE_LIMIT_WINDOW]
-    if len(_rate_limits[key]) >= RATE_LIMIT_MAX:
-        return False
-    _rate_limits[key].append(now)
-    return True
+    now = time.monotonic()
+    with _buckets_lock:
+        while _buckets:
+            oldest = next(iter(_buckets))
+            if now - _buckets[oldest][1] < RATE_LIMIT_WINDOW:
+                break
+            del _buckets[oldest]
+        tokens, last = _buckets.get(key, (RATE_LIMIT_MAX, now))
+        tokens = min(RATE_LIMIT_MAX, tokens + (now - last) * (RATE_LIMIT_MAX / RATE_LIMIT_WINDOW))
+        allowed = tokens >= 1
+        _buckets[key] = (tokens - 1 if allowed else tokens, now)
+        _buckets.move_to_end(key)
+        return allowed
+
+
+# ── Response caches (in-memory) ──
+# Debounced typing re-sends the same text; an identical (route, prompt text) pair
+# reuses the last GPT answer for a while instead of another round trip.
+# Weekly reports are cached here too, keyed on a hash of the entries they cover.
+# Only GPT answers are cached, never fallbacks.
+
+import hashlib
+
+GPT_CACHE_SIZE = 512
+GPT_CACHE_TTL = 600
+gpt_cache = LRUCache(GPT_CACHE_SIZE, ttl=GPT_CACHE_TTL)
+
+def _gpt_cache_key(route: str, text: str):
+    return route, text_key(text)
+
+# Decrypted entry lists and today's counts, keyed on entries_version() so any new or
+# edited entry misses. Separate so one user's history can't evict GPT answers.
+entries_cache = LRUCache(256, ttl=GPT_CACHE_TTL)
 
 
 # ── Auth decorator ──
@@ -86,65 +170,115 @@ SUPABASE_KEY = (
 OPENAI_KEY = (os.environ.get("OPENAI_API_KEY") or "").strip()
 
 
-# --- Page routes ---
-
-@app.route("/")
-def index():
-    return send_from_directory(".", "index.html")
-
-
-@app.route("/signup")
-def signup():
-    return send_from_directory(".", "signup.html")
-
+def _warm_up():
+    """Resolve DNS and open the pooled TLS connections before the first user request needs them."""
+    if OPENAI_KEY:
+        try:
+            get_openai(OPENAI_KEY).models.list()
+        except Exception as e:
+            print("[warm-up] OpenAI:", type(e).__name__, str(e))
+    supabase = get_supabase()
+    if supabase:
+        try:
+            supabase.table("signups").select("email").limit(1).execute()
+        except Exception as e:
+            print("[warm-up] Supabase:", type(e).__name__, str(e))
 
-@app.route("/login")
-def login():
-    return send_from_directory(".", "login.html")
 
+def start_warm_up():
+    """Run _warm_up in the background so requests don't wait on it. Called per process by
+    gunicorn.conf.py's post_worker_init and by __main__, never on import (tests import this module)."""
+    threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
 
-@app.route("/checkin")
-def checkin():
-    return send_from_directory(".", "checkin.html")
 
+# --- Page routes ---
 
-@app.route("/entry")
-def entry():
-    return send_from_directory(".", "entry.html")
+# route -> (endpoint, file)
+PAGE_ROUTES = {
+    "/": ("index", "index.html"),
+    "/signup": ("signup", "signup.html"),
+    "/login": ("login", "login.html"),
+    "/checkin": ("checkin", "checkin.html"),
+    "/entry": ("entry", "entry.html"),
+    "/history": ("history", "history.html"),
+    "/report/weekly": ("report", "report.html"),
+    "/auth/callback": ("auth_callback", "auth-callback.html"),
+    "/auth-callback": ("auth_callback_alt", "auth-callback.html"),  # for OAuth configs that use /auth-callback
+    "/report": ("report_page", "report.html"),
+    "/analysis": ("analysis", "analysis.html"),
+}
+
+
+@lru_cache(maxsize=None)
+def _load_page(filename: str) -> tuple:
+    """(body, gzipped body, etag) for a page, read and compressed once per process."""
+    with open(os.path.join(app.root_path, filename), "rb") as f:
+        body = f.read()
+    return body, gzip.compress(body, 9), hashlib.blake2b(body, digest_size=8).hexdigest()
+
+
+def _serve_page(filename: str):
+    # Debug mode re-reads so HTML edits show up without a restart
+    body, gz, etag = _load_page.__wrapped__(filename) if app.debug else _load_page(filename)
+    use_gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+    # Each encoding is a different representation, so it gets its own ETag
+    etag = f'"{etag}-gz"' if use_gzip else f'"{etag}"'
+    if etag in request.headers.get("If-None-Match", ""):
+        r = Response(status=304)
+    else:
+        r = Response(gz if use_gzip else body, mimetype="text/html")
+        if use_gzip:
+            r.headers["Content-Encoding"] = "gzip"
+    r.headers["ETag"] = etag
+    r.headers["Cache-Control"] = "no-cache"
+    r.headers["Vary"] = "Accept-Encoding"
+    return r
 
 
-@app.route("/history")
-def history():
-    return send_from_directory(".", "history.html")
+for _route, (_endpoint, _filename) in PAGE_ROUTES.items():
+    app.add_url_rule(_route, _endpoint, lambda filename=_filename: _serve_page(filename))
 
 
-@app.route("/report/weekly")
-def report():
-    return send_from_directory(".", "report.html")
+# --- API routes ---
 
+# False once a query shows entries lacks entry_number/is_follow_up (supabase-multi-entries.sql
+# not run), so later requests go straight to the narrower query instead of failing first
+_multi_entry_cols = None
 
-@app.route("/auth/callback")
-def auth_callback():
-    return send_from_directory(".", "auth-callback.html")
 
+def _query_entries(full, minimal):
+    """(result, has_multi_entry_cols): full() needs the multi-entry columns, minimal() doesn't."""
+    global _multi_entry_cols
+    if _multi_entry_cols is not False:
+        try:
+            return full(), True
+        except Exception as e:
+            # Anything other than the missing columns is a real error, not a schema probe
+            if "entry_number" not in str(e) and "is_follow_up" not in str(e):
+                raise
+            _multi_entry_cols = False
+    return minimal(), False
 
-@app.route("/auth-callback")
-def auth_callback_alt():
-    """Alias for OAuth configs that use /auth-callback."""
-    return send_from_directory(".", "auth-callback.html")
 
+def _entries_version(supabase, user_id: str):
+    """Fingerprint of the user's entries (supabase-entries-version.sql), or None before that migration."""
+    try:
+        return supabase.rpc("entries_version", {"uid": user_id}).execute().data or None
+    except Exception:
+        return None
 
-@app.route("/report")
-def report_page():
-    return send_from_directory(".", "report.html")
 
+def _version_etag(*parts) -> str:
+    return '"' + hashlib.blake2b(":".join(parts).encode(), digest_size=8).hexdigest() + '"'
 
-@app.route("/analysis")
-def analysis():
-    return send_from_directory(".", "analysis.html")
 
+def _with_etag(r, etag):
+    """Mark a private response revalidatable; browsers send If-None-Match on the next fetch."""
+    if etag:
+        r.headers["ETag"] = etag
+        r.headers["Cache-Control"] = "private, no-cache"
+    return r
 
-# --- API routes ---
 
 @app.route("/api/entries", methods=["GET"])
 @require_auth
@@ -154,28 +288,42 @@ def list_entries():
     supabase = get_supabase_for_user(request.access_token)
     if not supabase:
         return jsonify({"error": "Server not configured"}), 503
-    try:
+
+    # Unchanged entries (same count + latest updated_at): 304 for the browser, or the
+    # cached payload, instead of re-fetching and decrypting up to 90 rows
+    version = _entries_version(supabase, user_id)
+    etag = _version_etag(user_id, version) if version else None
+    if etag and etag in request.headers.get("If-None-Match", ""):
+        return _with_etag(Response(status=304), etag)
+    body = entries_cache.get(("entries", user_id, version)) if version else None
+    if body is None:
         try:
-            result = supabase.table("entries").select(
-                "id, date, sleep_hours, sleep_quality, energy, deep_work_blocks, reflection_summary, entry_number, is_follow_up"
-            ).eq("user_id", user_id).order("date", desc=True).limit(90).execute()
-        except Exception:
-            result = supabase.table("entries").select(
-                "id, date, sleep_hours, sleep_quality, energy, deep_work_blocks, reflection_summary"
-            ).eq("user_id", user_id).order("date", desc=True).limit(90).execute()
-        entries = result.data or []
-        for e in entries:
-            e["sleep_hours"] = decrypt_float(e.get("sleep_hours"), 0)
-            e["sleep_quality"] = decrypt_int(e.get("sleep_quality"), 3)
-            e["energy"] = decrypt_int(e.get("energy"), 3)
-            e["deep_work_blocks"] = decrypt_int(e.get("deep_work_blocks"), 0)
-            e["reflection_summary"] = decrypt(e.get("reflection_summary") or "")
-            e["predicted_impact"] = decrypt(e.get("predicted_impact") or "")
-            e["experiment_for_tomorrow"] = decrypt(e.get("experiment_for_tomorrow") or "")
-            e["likely_drivers"] = [decrypt(d) for d in (e.get("likely_drivers") or [])]
-        return jsonify({"data": entries})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+            body = {"data": _fetch_entries(supabase, user_id)}
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        if version:
+            entries_cache.put(("entries", user_id, version), body)
+    return _with_etag(jsonify(body), etag)
+
+
+def _fetch_entries(supabase, user_id: str) -> list:
+    """Up to 90 of the user's entries, newest first, with numeric fields and summaries decrypted."""
+    result, _ = _query_entries(
+        lambda: supabase.table("entries").select(
+            "id, date, sleep_hours, sleep_quality, energy, deep_work_blocks, reflection_summary, entry_number, is_follow_up"
+        ).eq("user_id", user_id).order("date", desc=True).limit(90).execute(),
+        lambda: supabase.table("entries").select(
+            "id, date, sleep_hours, sleep_quality, energy, deep_work_blocks, reflection_summary"
+        ).eq("user_id", user_id).order("date", desc=True).limit(90).execute(),
+    )
+    entries = result.data or []
+    for e in entries:
+        e["sleep_hours"] = decrypt_float(e.get("sleep_hours"), 0)
+        e["sleep_quality"] = decrypt_int(e.get("sleep_quality"), 3)
+        e["energy"] = decrypt_int(e.get("energy"), 3)
+        e["deep_work_blocks"] = decrypt_int(e.get("deep_work_blocks"), 0)
+        e["reflection_summary"] = decrypt(e.get("reflection_summary") or "")
+    return entries
 
 
 @app.route("/api/entries/today", methods=["GET"])
@@ -183,31 +331,66 @@ def list_entries():
 def today_entries():
     """Check how many entries the user has for today and total unique days logged."""
     user_id = request.authenticated_user_id
-    today = __import__("datetime").date.today().isoformat()
+    today = date.today().isoformat()
     supabase = get_supabase_for_user(request.access_token)
     if not supabase:
         return jsonify({"error": "Server not configured"}), 503
+    # Polled by the check-in page; two queries collapse to one version check while nothing changes
+    version = _entries_version(supabase, user_id)
+    etag = _version_etag(user_id, today, version) if version else None
+    if etag and etag in request.headers.get("If-None-Match", ""):
+        return _with_etag(Response(status=304), etag)
+    cache_key = ("entries-today", user_id, today, version)
+    cached = entries_cache.get(cache_key) if version else None
+    if cached is not None:
+        return _with_etag(jsonify(cached), etag)
     try:
-        try:
-            result = supabase.table("entries").select("id, entry_number, is_follow_up").eq(
+        result, _ = _query_entries(
+            lambda: supabase.table("entries").select("id, entry_number, is_follow_up").eq(
                 "user_id", user_id
-            ).eq("date", today).order("entry_number", desc=False).execute()
-        except Exception:
-            result = supabase.table("entries").select("id").eq(
+            ).eq("date", today).order("entry_number", desc=False).execute(),
+            lambda: supabase.table("entries").select("id").eq(
                 "user_id", user_id
-            ).eq("date", today).execute()
+            ).eq("date", today).execute(),
+        )
         entries = result.data or []
         today_count = len(entries)
 
-        result_all = supabase.table("entries").select("date").eq("user_id", user_id).order("date", desc=True).limit(100).execute()
-        all_dates = result_all.data or []
-        unique_days = len(set(r.get("date") for r in all_dates if r.get("date")))
+        try:
+            # Counted in Postgres (supabase-unique-days.sql)
+            unique_days = supabase.rpc("unique_day_count", {"uid": user_id}).execute().data or 0
+        except Exception:
+            result_all = supabase.table("entries").select("date").eq("user_id", user_id).order("date", desc=True).limit(100).execute()
+            unique_days = len(set(r.get("date") for r in (result_all.data or []) if r.get("date")))
 
-        return jsonify({"count": today_count, "entries": entries, "unique_days": unique_days})
+        out = {"count": today_count, "entries": entries, "unique_days": unique_days}
+        if version:
+            entries_cache.put(cache_key, out)
+        return _with_etag(jsonify(out), etag)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def _entry_with_day_meta(supabase, entry_id, user_id):
+    """The entry plus its day's max_entry_number and entry_count, or None if it isn't the user's."""
+    try:
+        # One round trip (supabase-entry-detail.sql)
+        return supabase.rpc("get_entry_with_day_meta", {"p_entry_id": entry_id, "p_user_id": user_id}).execute().data
+    except Exception:
+        pass
+    rows = supabase.table("entries").select("*").eq("id", entry_id).eq("user_id", user_id).limit(1).execute().data
+    if not rows:
+        return None
+    entry = rows[0]
+    try:
+        same_day = supabase.table("entries").select("entry_number").eq("user_id", user_id).eq("date", entry.get("date")).execute()
+        nums = [r.get("entry_number") or 1 for r in (same_day.data or [])]
+        entry["max_entry_number"], entry["entry_count"] = max(nums, default=1), len(nums)
+    except Exception:
+        pass  # no entry_number column (supabase-multi-entries.sql not run): one entry per day
+    return entry
+
+
 @app.route("/api/entries/<entry_id>", methods=["GET"])
 @require_auth
 def get_entry(entry_id):
@@ -219,8 +402,7 @@ def get_entry(entry_id):
     if not supabase:
         return jsonify({"error": "Server not configured"}), 503
     try:
-        result = supabase.table("entries").select("*").eq("id", entry_id).eq("user_id", user_id).single().execute()
-        entry = result.data
+        entry = _entry_with_day_meta(supabase, entry_id, user_id)
         if not entry:
             return jsonify({"error": "Entry not found"}), 404
         def safe_decrypt(val):
@@ -236,25 +418,25 @@ def get_entry(entry_id):
         entry["predicted_impact"] = safe_decrypt(entry.get("predicted_impact"))
         entry["experiment_for_tomorrow"] = safe_decrypt(entry.get("experiment_for_tomorrow"))
         entry["likely_drivers"] = [safe_decrypt(d) for d in (entry.get("likely_drivers") or [])]
-        entry_date = entry.get("date")
-        entry_num = entry.get("entry_number") or 1
-        try:
-            same_day = supabase.table("entries").select("entry_number").eq("user_id", user_id).eq("date", entry_date).execute()
-            nums = [r.get("entry_number") or 1 for r in (same_day.data or [])]
-            max_num = max(nums) if nums else 1
-            entry["is_final_for_day"] = (entry_num == max_num) or (len(nums) == 1)
-        except Exception:
-            entry["is_final_for_day"] = True
+        max_num = entry.pop("max_entry_number", None) or 1
+        day_count = entry.pop("entry_count", 1)
+        entry["is_final_for_day"] = ((entry.get("entry_number") or 1) == max_num) or day_count <= 1
         return jsonify({"data": entry})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+# Fixed /api/join success bodies, serialized once
+_JOIN_OK = orjson.dumps({"ok": True, "message": "You're on the list. We'll be in touch."})
+_JOIN_DUPLICATE = orjson.dumps({"ok": True, "message": "You're already on the list."})
+
+
 @app.route("/api/join", methods=["POST"])
 def join():
     data = request.get_json(force=True, silent=True) or {}
-    email = (data.get("email") or "").strip().lower()
-    if not email or "@" not in email:
+    # Reject junk locally instead of after a Supabase round trip
+    email = validate_email(data.get("email"))
+    if not email:
         return jsonify({"ok": False, "error": "Valid email required"}), 400
 
     supabase = get_supabase()
@@ -263,11 +445,11 @@ def join():
 
     try:
         supabase.table("signups").insert({"email": email}).execute()
-        return jsonify({"ok": True, "message": "You're on the list. We'll be in touch."})
+        return Response(_JOIN_OK, mimetype="application/json")
     except Exception as e:
         err = str(e).lower()
         if "duplicate" in err or "unique" in err or "already" in err:
-            return jsonify({"ok": True, "message": "You're already on the list."})
+            return Response(_JOIN_DUPLICATE, mimetype="application/json")
         print("[api/join error]", type(e).__name__, str(e))
         return jsonify({"ok": False, "error": "Something went wrong"}), 500
 
@@ -281,6 +463,49 @@ def _pending_analysis_result():
     }
 
 
+# False once upsert_entry() turns out to be missing (supabase-upsert-entry.sql not run)
+_has_upsert_entry = None
+
+
+def _upsert_entry(supabase, row: dict):
+    """Number and insert a first entry via upsert_entry(): {"id", "entry_number", ...},
+    or None if the function doesn't exist, leaving the caller to look up and insert."""
+    global _has_upsert_entry
+    try:
+        r = supabase.rpc("upsert_entry", {"p_row": dict(row, is_follow_up=False), "p_overwrite": False}).execute()
+    except Exception as e:
+        # Only "function not found" (PGRST202 / 42883) is safe to retry as an insert
+        if "PGRST202" not in str(e) and "42883" not in str(e):
+            raise
+        _has_upsert_entry = False
+        return None
+    _has_upsert_entry = True
+    return r.data[0]
+
+
+def _day_entries(supabase, user_id: str, entry_date: str, with_transcripts: bool) -> tuple:
+    """(existing entries for the date, next entry_number, has_multi_entry_cols)."""
+    # Only the final follow-up needs every transcript; otherwise entry_lookup
+    # (supabase-entry-lookup.sql) returns the next number and first entry's anchors in one row.
+    if not with_transcripts:
+        try:
+            lookup = supabase.rpc("entry_lookup", {"uid": user_id, "d": entry_date}).execute().data or {}
+            existing_entries = [lookup["first"]] if lookup.get("first") else []
+            return existing_entries, (lookup.get("max_number") or 0) + 1, True
+        except Exception:
+            pass
+    existing, has_multi_entry_cols = _query_entries(
+        lambda: supabase.table("entries").select("id, entry_number, sleep_hours, sleep_quality, energy, deep_work_blocks, transcript").eq("user_id", user_id).eq("date", entry_date).order("entry_number", desc=False).execute(),
+        lambda: supabase.table("entries").select("id, sleep_hours, sleep_quality, energy, deep_work_blocks, transcript").eq("user_id", user_id).eq("date", entry_date).execute(),
+    )
+    existing_entries = existing.data or []
+    if has_multi_entry_cols:
+        next_number = (existing_entries[-1]["entry_number"] + 1) if existing_entries else 1
+    else:
+        next_number = len(existing_entries) + 1
+    return existing_entries, next_number, has_multi_entry_cols
+
+
 @app.route("/api/analyze", methods=["POST"])
 @require_auth
 def analyze():
@@ -291,12 +516,7 @@ def analyze():
     if not supabase:
         return jsonify({"error": "Server not configured"}), 503
 
-    transcript = sanitize_text(data.get("transcript", "") or "", max_length=5000)
-    sleep_hours = clamp_float(data.get("sleep_hours", 0), 0, 24, default=0)
-    sleep_quality = clamp_int(data.get("sleep_quality", 3), 1, 5, default=3)
-    energy = clamp_int(data.get("energy", 3), 1, 5, default=3)
-    deep_work = clamp_int(data.get("deep_work_blocks", 0), 0, 5, default=0)
-    entry_date = validate_date(data.get("date", ""))
+    transcript, sleep_hours, sleep_quality, energy, deep_work, entry_date = parse_checkin(data)
     if not entry_date:
         return jsonify({"error": "Valid date required (YYYY-MM-DD)"}), 400
 
@@ -304,16 +524,21 @@ def analyze():
     plan_more_reflections = data.get("plan_more_reflections") in (True, "true", 1)
     is_last_reflection = data.get("is_last_reflection") in (True, "true", 1)
 
-    has_multi_entry_cols = True
-    try:
-        existing = supabase.table("entries").select("id, entry_number, sleep_hours, sleep_quality, energy, deep_work_blocks, transcript").eq("user_id", user_id).eq("date", entry_date).order("entry_number", desc=False).execute()
-        existing_entries = existing.data or []
-        next_number = (existing_entries[-1]["entry_number"] + 1) if existing_entries else 1
-    except Exception:
-        has_multi_entry_cols = False
-        existing = supabase.table("entries").select("id, sleep_hours, sleep_quality, energy, deep_work_blocks, transcript").eq("user_id", user_id).eq("date", entry_date).execute()
-        existing_entries = existing.data or []
-        next_number = len(existing_entries) + 1
+    if is_follow_up:
+        skip_analysis = not is_last_reflection
+    else:
+        skip_analysis = plan_more_reflections
+
+    # A first entry only needs the day's lookup for its entry_number, which upsert_entry
+    # works out under a lock in the same round trip as the insert
+    use_upsert = not is_follow_up and _has_upsert_entry is not False
+
+    if use_upsert:
+        existing_entries = []
+    else:
+        existing_entries, next_number, has_multi_entry_cols = _day_entries(
+            supabase, user_id, entry_date, with_transcripts=is_follow_up and is_last_reflection,
+        )
 
     if is_follow_up and existing_entries:
         first = existing_entries[0]
@@ -322,12 +547,6 @@ def analyze():
         energy = decrypt_int(first.get("energy"), energy)
         deep_work = decrypt_int(first.get("deep_work_blocks"), deep_work)
 
-    skip_analysis = False
-    if is_follow_up:
-        skip_analysis = not is_last_reflection
-    else:
-        skip_analysis = plan_more_reflections
-
     if skip_analysis:
         result = _pending_analysis_result()
     elif is_follow_up and is_last_reflection and existing_entries:
@@ -341,14 +560,11 @@ def analyze():
             parts.append(f"Reflection {len(existing_entries) + 1}: " + transcript.strip())
         combined = "\n\n".join(parts) if parts else transcript
         result = analyze_with_gpt(combined, sleep_hours, sleep_quality, energy, deep_work, api_key=OPENAI_KEY)
-        if result.get("likely_drivers") == ["Analysis pending"]:
-            err = result.get("_error", "Unknown error")
-            return jsonify({"error": f"Analysis failed: {err}"}), 503
     else:
         result = analyze_with_gpt(transcript, sleep_hours, sleep_quality, energy, deep_work, api_key=OPENAI_KEY)
-        if result.get("likely_drivers") == ["Analysis pending"]:
-            err = result.get("_error", "Unknown error")
-            return jsonify({"error": f"Analysis failed: {err}"}), 503
+    if not skip_analysis and result.get("likely_drivers") == ["Analysis pending"]:
+        err = result.get("_error", "Unknown error")
+        return jsonify({"error": f"Analysis failed: {err}"}), 503
 
     row = {
         "user_id": user_id,
@@ -363,6 +579,20 @@ def analyze():
         "predicted_impact": encrypt(result.get("predicted_impact", "")),
         "experiment_for_tomorrow": encrypt(result.get("experiment_for_tomorrow", "")),
     }
+    if use_upsert:
+        try:
+            saved = _upsert_entry(supabase, row)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        if saved is not None:
+            out = {"entry_id": str(saved["id"]), "entry_number": saved["entry_number"]}
+            if skip_analysis:
+                out["skipped_analysis"] = True
+            return jsonify(out)
+        existing_entries, next_number, has_multi_entry_cols = _day_entries(
+            supabase, user_id, entry_date, with_transcripts=False,
+        )
+
     if has_multi_entry_cols:
         row["entry_number"] = next_number
         row["is_follow_up"] = is_follow_up and next_number > 1
@@ -378,8 +608,8 @@ def analyze():
                 "predicted_impact": encrypt(result.get("predicted_impact", "")),
                 "experiment_for_tomorrow": encrypt(result.get("experiment_for_tomorrow", "")),
             }
-            for e in existing_entries:
-                supabase.table("entries").update(update_data).eq("id", e["id"]).execute()
+            # One PATCH for all of the day's earlier reflections instead of one per entry
+            supabase.table("entries").update(update_data).in_("id", [e["id"] for e in existing_entries]).execute()
 
         out = {"entry_id": str(entry_id), "entry_number": next_number}
         if skip_analysis:
@@ -397,42 +627,27 @@ def analyze():
         return jsonify({"error": err}), 500
 
 
-# Demo report: no auth, uses test data (7 days of reflections)
-DEMO_ENTRIES = [
-    {"date": "2026-02-17", "sleep_hours": 6, "sleep_quality": 2, "energy": 2, "deep_work_blocks": 0,
-     "reflection_summary": "Stayed up until 2am scrolling. Woke up groggy at 8. Had a lecture at 10 but couldn't focus. Spent most of the day on admin tasks. Felt scattered and unmotivated. Skipped the gym.",
-     "likely_drivers": ["Late-night phone use disrupted melatonin production", "Sleep debt reduced executive function"], "experiment_for_tomorrow": "Phone in another room by 11pm"},
-    {"date": "2026-02-18", "sleep_hours": 7.5, "sleep_quality": 3, "energy": 3, "deep_work_blocks": 1,
-     "reflection_summary": "Better sleep but still felt residual tiredness. Got one deep work block on my assignment in the morning. After lunch energy crashed hard. Ate too much pasta. Spent afternoon in meetings that could have been emails.",
-     "likely_drivers": ["Post-lunch glucose crash", "Residual sleep debt from previous night"], "experiment_for_tomorrow": "Light lunch, walk after eating"},
-    {"date": "2026-02-19", "sleep_hours": 7, "sleep_quality": 4, "energy": 4, "deep_work_blocks": 2,
-     "reflection_summary": "Slept well. Woke up at 7:30 naturally. Got two solid deep work blocks before noon. Felt locked in. Phone was in another room which helped. Had a great conversation with a classmate about the project. Energy dipped slightly around 3pm but recovered.",
-     "likely_drivers": ["Phone removal reduced attentional residue", "Morning deep work leveraged peak cortisol"], "experiment_for_tomorrow": "Repeat morning routine"},
-    {"date": "2026-02-20", "sleep_hours": 5.5, "sleep_quality": 2, "energy": 2, "deep_work_blocks": 0,
-     "reflection_summary": "Deadline stress kept me up. Worked until 1am on the assignment. Woke up at 6:30 feeling terrible. Couldn't concentrate in any lecture. Had 3 coffees by noon. Felt jittery and anxious. No deep work happened. The work I did last night was probably low quality anyway.",
-     "likely_drivers": ["Acute sleep restriction impaired prefrontal cortex", "Caffeine-induced anxiety", "Decision fatigue from deadline pressure"], "experiment_for_tomorrow": "Set hard stop at 11pm regardless of deadline"},
-    {"date": "2026-02-21", "sleep_hours": 8, "sleep_quality": 4, "energy": 3, "deep_work_blocks": 1,
-     "reflection_summary": "Crashed early at 9pm, slept 8 hours. Body needed recovery. Morning was slow to start, felt like I was coming out of a fog. By afternoon managed one focused session. Submitted the assignment. Felt relief but also drained. Went for a walk which helped clear my head.",
-     "likely_drivers": ["Recovery sleep restored some executive function", "Post-deadline relief reduced cognitive load"], "experiment_for_tomorrow": "Morning walk before any screens"},
-    {"date": "2026-02-22", "sleep_hours": 7.5, "sleep_quality": 4, "energy": 4, "deep_work_blocks": 2,
-     "reflection_summary": "Good sleep again. Started with a 20min walk, then straight into deep work. Got two blocks done on the new project. Lunch was light — salad and protein. Afternoon energy stayed high. Didn't touch phone until 2pm. This felt like my best day this week.",
-     "likely_drivers": ["Consistent sleep restored working memory", "Morning walk elevated baseline arousal", "Delayed phone use prevented attentional residue"], "experiment_for_tomorrow": "Replicate: walk → deep work → light lunch"},
-    {"date": "2026-02-23", "sleep_hours": 7, "sleep_quality": 3, "energy": 3, "deep_work_blocks": 1,
-     "reflection_summary": "Decent sleep but woke up once around 3am — might have been the late dinner. Started slower today. One deep work block in the morning. Got distracted by social media after lunch. Had a productive conversation about my project with my boss. Feeling okay overall, not great not terrible.",
-     "likely_drivers": ["Late dinner disrupted sleep continuity", "Social media broke afternoon focus momentum"], "experiment_for_tomorrow": "Dinner before 8pm, block social media until 4pm"},
-]
-
-
-@app.route("/api/weekly-report-demo", methods=["POST"])
-def weekly_report_demo():
-    """No auth. Returns GPT-generated report from 7 days of test reflections."""
+def _demo_report():
+    """Weekly report over the 7 demo reflections (test data + real GPT)."""
+    # The demo input never changes, so one generated report serves every visitor for GPT_CACHE_TTL
+    cached = gpt_cache.get(("weekly-report-demo",))
+    if cached is not None:
+        return jsonify(cached)
     report = weekly_report_mod.generate_weekly_report(DEMO_ENTRIES, api_key=OPENAI_KEY)
     if report.get("error") and not report.get("week_narrative"):
         return jsonify(report), 503
     report["entries"] = DEMO_ENTRIES
+    if not report.get("error"):
+        gpt_cache.put(("weekly-report-demo",), report)
     return jsonify(report)
 
 
+@app.route("/api/weekly-report-demo", methods=["POST"])
+def weekly_report_demo():
+    """No auth. Returns GPT-generated report from 7 days of test reflections."""
+    return _demo_report()
+
+
 @app.route("/api/weekly-report", methods=["POST"])
 @require_auth
 def weekly_report():
@@ -441,49 +656,51 @@ def weekly_report():
 
     # Demo mode: use test data + real GPT
     if data.get("demo"):
-        report = weekly_report_mod.generate_weekly_report(DEMO_ENTRIES, api_key=OPENAI_KEY)
-        if report.get("error") and not report.get("week_narrative"):
-            return jsonify(report), 503
-        report["entries"] = DEMO_ENTRIES
-        return jsonify(report)
+        return _demo_report()
 
     supabase = get_supabase_for_user(request.access_token)
     if not supabase:
         return jsonify({"error": "Server not configured"}), 503
 
     try:
-        result = supabase.table("entries").select("*").eq("user_id", user_id).order("date", desc=True).limit(30).execute()
-        entries = result.data or []
+        # One entry per date, so same-day follow-ups don't crowd real days out of the prompt
+        recent = weekly_report_mod.fetch_recent_entries(supabase, user_id)
     except Exception as e:
         return jsonify({"error": f"Failed to fetch entries: {e}"}), 500
 
-    for entry in entries:
+    entries_count = len(recent)
+    if entries_count < 7:
+        return jsonify({"locked": True, "entries_count": entries_count, "needed": 7})
+
+    cache_key = weekly_report_mod.report_cache_key(recent)
+    # Same entries as a recent request on this process: skip decrypting and the report lookup
+    mem_key = ("weekly-report", user_id, cache_key)
+    cached = gpt_cache.get(mem_key)
+    if cached is not None:
+        return jsonify(cached)
+    # Decrypt only the entries that are actually used
+    for entry in recent:
         entry["sleep_hours"] = decrypt_float(entry.get("sleep_hours"), 0)
         entry["sleep_quality"] = decrypt_int(entry.get("sleep_quality"), 3)
         entry["energy"] = decrypt_int(entry.get("energy"), 3)
         entry["deep_work_blocks"] = decrypt_int(entry.get("deep_work_blocks"), 0)
-        entry["transcript"] = decrypt(entry.get("transcript") or "")
         entry["reflection_summary"] = decrypt(entry.get("reflection_summary") or "")
-        entry["predicted_impact"] = decrypt(entry.get("predicted_impact") or "")
         entry["experiment_for_tomorrow"] = decrypt(entry.get("experiment_for_tomorrow") or "")
         entry["likely_drivers"] = [decrypt(d) for d in (entry.get("likely_drivers") or [])]
 
-    unique_dates = sorted(set(e.get("date") for e in entries if e.get("date")), reverse=True)
-    entries_count = len(unique_dates)
-    if entries_count < 7:
-        return jsonify({"locked": True, "entries_count": entries_count, "needed": 7})
-
-    report = weekly_report_mod.generate_weekly_report(entries[:14], api_key=OPENAI_KEY)
-    if report.get("error") and not report.get("week_narrative"):
-        return jsonify(report), 503
+    # Same entries as last time: reuse that report instead of calling GPT again
+    report = weekly_report_mod.load_cached_report(supabase, user_id, cache_key)
+    if report is None:
+        report = weekly_report_mod.generate_weekly_report(recent, api_key=OPENAI_KEY)
+        if report.get("error") and not report.get("week_narrative"):
+            return jsonify(report), 503
+        if not report.get("error"):
+            weekly_report_mod.save_cached_report(supabase, user_id, cache_key, report)
 
-    # Include entries for chart rendering (first entry per date, sorted ascending)
-    by_date = {}
-    for e in entries[:14]:
-        d = e.get("date")
-        if d and (d not in by_date or (e.get("entry_number") == 1)):
-            by_date[d] = e
-    report["entries"] = [by_date[d] for d in sorted(by_date.keys())]
+    # Entries for chart rendering, sorted ascending
+    report["entries"] = recent[::-1]
+    if not report.get("error"):
+        gpt_cache.put(mem_key, report)
     return jsonify(report)
 
 
@@ -532,9 +749,7 @@ def send_reminders():
         return jsonify({"error": "RESEND_API_KEY not set"}), 503
 
     sr_mod = importlib.import_module("api.send-reminders")
-    from datetime import date as _date
-
-    today = _date.today().isoformat()
+    today = date.today().isoformat()
 
     try:
         users_resp = supabase.auth.admin.list_users()
@@ -572,12 +787,11 @@ def send_reminders():
         if meta:
             user_name = meta.get("full_name", "") or meta.get("name", "")
             if user_name:
-                user_name = user_name.split()[0]
+                user_name = user_name.strip().partition(" ")[0]
 
         try:
             if sent > 0:
-                import time as _time
-                _time.sleep(1)
+                time.sleep(1)
             subject = "Welcome to Signal — start your first check-in" if day_number == 1 else f"Day {day_number}/7 — Time for your check-in"
             html = sr_mod.build_reminder_html(day_number, user_name)
             sr_mod.send_email(email, subject, html)
@@ -632,8 +846,7 @@ def send_invites():
 
         try:
             if sent > 0:
-                import time as _time
-                _time.sleep(1)
+                time.sleep(1)
 
             html = f"""<!DOCTYPE html><html><head><meta charset="UTF-8"></head>
 <body style="margin:0;padding:0;background:#050505;font-family:'Inter',system-ui,-apple-system,sans-serif;">
@@ -680,47 +893,8 @@ def send_invites():
     return jsonify({"ok": True, "sent": sent, "skipped": skipped, "total_signups": len(signups), "errors": errors[:10]})
 
 
-def _fallback_clarify(text: str) -> list:
-    """Return simple clarifying questions when GPT is not available."""
-    t = text.lower()
-    questions = []
-    if any(w in t for w in ["tired", "exhausted", "drained", "low energy"]):
-        questions.append("How did you sleep last night?")
-    if any(w in t for w in ["blue", "down", "bothered", "sad", "don't feel", "dont feel"]):
-        questions.append("How did that affect your energy for work today?")
-    if any(w in t for w in ["unproductive", "unfocused", "wasted", "sat the whole day"]):
-        questions.append("What got in the way of feeling productive today?")
-    if any(w in t for w in ["unsure", "confused", "bored", "unmotivated", "not sure"]):
-        questions.append("What did you attempt today that mattered to you?")
-    if any(w in t for w in ["fight", "argument", "conflict", "bf", "boyfriend", "girlfriend"]):
-        questions.append("How did that affect your energy for work today?")
-    if any(w in t for w in ["stress", "anxious", "overwhelmed", "stuck"]):
-        questions.append("What got in the way of your focus?")
-    if any(w in t for w in ["sleep", "slept", "rest", "enough sleep"]):
-        questions.append("What might have affected your sleep quality?")
-    if not questions:
-        questions.append("What got in the way of your best work today?")
-    return questions[:2]  # Max 2
-
-
-@app.route("/api/check-topics", methods=["POST", "OPTIONS"])
-def check_topics():
-    if request.method == "OPTIONS":
-        r = Response("", 204)
-        r.headers["Access-Control-Allow-Origin"] = "*"
-        r.headers["Access-Control-Allow-Methods"] = "POST, OPTIONS"
-        r.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization"
-        return r
-    data = request.get_json(force=True, silent=True) or {}
-    text = sanitize_text((data.get("text") or ""), max_length=2000)
-    if len(text) < 5:
-        return jsonify({"missing": ["How did you sleep?", "What are you feeling?", "What did you attempt?"]})
-    if not OPENAI_KEY:
-        return jsonify({"missing": _fallback_check_topics(text)})
-    try:
-        import openai
-        client = openai.OpenAI(api_key=OPENAI_KEY)
-        prompt = f"""A user recorded a daily voice reflection for a cognitive performance tool. Analyze it for completeness AND quality.
+# Fixed rubric as the system message, reflection last: every call shares the same prefix
+_CHECK_TOPICS_INSTRUCTIONS = """A user recorded a daily voice reflection for a cognitive performance tool. Analyze it for completeness AND quality.
 
 STEP 1 — Check if 3 core topics are covered. Be lenient — any mention counts.
   TOPIC 1 — "How did you sleep?" (sleep, waking, tiredness from sleep, hours, etc.)
@@ -734,43 +908,57 @@ STEP 2 — Check for reflection quality issues:
     - Off-topic: mostly about other people's business, gossip, unrelated stories with no connection to the user's own performance → flag
   If biased or off-topic, add a gentle guiding question to "missing".
 
-Reflection: "{text[:1200]}"
-
 Return JSON only:
-{{
+{
   "missing": ["exact topic questions from above OR a guiding question for bias/off-topic"],
   "bias_warning": null or a short string like "mostly_positive", "mostly_negative", "off_topic" if detected
-}}
-Return {{"missing": [], "bias_warning": null}} if complete and balanced."""
-        r = client.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": prompt}], temperature=0.1, max_tokens=100)
+}
+Return {"missing": [], "bias_warning": null} if complete and balanced."""
+
+
+@app.route("/api/check-topics", methods=["POST", "OPTIONS"])
+def check_topics():
+    data = request.get_json(force=True, silent=True) or {}
+    text = sanitize_text((data.get("text") or ""), max_length=2000)
+    if len(text) < 5:
+        return jsonify({"missing": list(TOPIC_QUESTIONS)})
+    if not OPENAI_KEY:
+        return jsonify({"missing": fallback_check_topics(text)})
+    # Keywords for every topic in a short reflection: accept without a GPT round trip, as
+    # api/check-topics.py does. Longer ones still go to GPT for the bias / off-topic check.
+    if len(text) < 400 and not fallback_check_topics(text):
+        return jsonify({"missing": [], "bias_warning": None})
+    cache_key = _gpt_cache_key("check-topics", text[:1200])
+    cached = gpt_cache.get(cache_key)
+    if cached is not None:
+        return jsonify(cached)
+    try:
+        client = get_openai(OPENAI_KEY)
+        r = client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": _CHECK_TOPICS_INSTRUCTIONS},
+                {"role": "user", "content": f'Reflection: "{text[:1200]}"'},
+            ],
+            temperature=0.1, max_tokens=100,
+        )
         raw = (r.choices[0].message.content or "").strip()
-        if raw.startswith("```"): raw = raw.split("```")[1].replace("json", "").strip()
+        raw = strip_code_fence(raw)
         start = raw.find("{"); end = raw.rfind("}") + 1
         if start >= 0 and end > start: raw = raw[start:end]
-        out = json.loads(raw)
+        out = orjson.loads(raw)
         missing = out.get("missing", []) if isinstance(out, dict) else out
         if isinstance(missing, list):
             missing = [q for q in missing if isinstance(q, str)]
         else:
             missing = []
         bias = out.get("bias_warning") if isinstance(out, dict) else None
-        return jsonify({"missing": missing, "bias_warning": bias})
+        body = {"missing": missing, "bias_warning": bias}
+        gpt_cache.put(cache_key, body)
+        return jsonify(body)
     except Exception as e:
         print("[check-topics] GPT error:", type(e).__name__, str(e))
-        return jsonify({"missing": _fallback_check_topics(text)})
-
-
-def _fallback_check_topics(text: str) -> list:
-    """Keyword fallback when GPT unavailable."""
-    t = text.lower()
-    missing = []
-    if not re.search(r"\b(sleep|slept|rest|woke|nap|bed|insomnia|alright|well|hours?|asleep|restorative|restless)\b", t):
-        missing.append("How did you sleep?")
-    if not re.search(r"\b(feel|felt|feeling|energy|mood|stressed|anxious|happy|sad|tired|exhausted|drained|bothered|down|low|great|calm|relaxed|motivated|restless|groggy|heavy)\b", t) and not re.search(r"(feel|i'm|im)\s+(okay|fine|good|bad)", t):
-        missing.append("What are you feeling?")
-    if not re.search(r"\b(work|worked|attempt|tried|did|task|project|focus|study|meeting|class|productive|unproductive|nothing|read|exercise|chilled)\b", t):
-        missing.append("What did you attempt?")
-    return missing
+        return jsonify({"missing": fallback_check_topics(text)})
 
 
 @app.route("/api/test-gpt")
@@ -779,8 +967,7 @@ def test_gpt():
     if not OPENAI_KEY:
         return jsonify({"ok": False, "error": "OPENAI_API_KEY not set in .env"})
     try:
-        import openai
-        r = openai.OpenAI(api_key=OPENAI_KEY).chat.completions.create(
+        r = get_openai(OPENAI_KEY).chat.completions.create(
             model="gpt-4o-mini", messages=[{"role": "user", "content": "Reply with exactly: OK"}], max_tokens=5
         )
         reply = (r.choices[0].message.content or "").strip()
@@ -791,42 +978,29 @@ def test_gpt():
 
 @app.route("/api/clarify", methods=["POST", "OPTIONS"])
 def clarify():
-    if request.method == "OPTIONS":
-        r = Response("", 204)
-        r.headers["Access-Control-Allow-Origin"] = "*"
-        r.headers["Access-Control-Allow-Methods"] = "POST, OPTIONS"
-        r.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization"
-        return r
     data = request.get_json(force=True, silent=True) or {}
     text = sanitize_text((data.get("text") or ""), max_length=2000)
     if len(text) < 15:
         return jsonify({"questions": [], "source": "none"})
     if not OPENAI_KEY:
-        return jsonify({"questions": _fallback_clarify(text), "source": "fallback", "error": "OPENAI_API_KEY not set"})
+        return jsonify({"questions": fallback_clarify(text), "source": "fallback", "error": "OPENAI_API_KEY not set"})
+    cache_key = _gpt_cache_key("clarify", text[:500])
+    cached = gpt_cache.get(cache_key)
+    if cached is not None:
+        return jsonify(cached)
     try:
-        import openai
-        client = openai.OpenAI(api_key=OPENAI_KEY)
-        prompt = f"""You are Signal, a performance pattern detection engine. You detect factors impacting productivity. You do NOT provide therapy. NEVER ask about feelings, emotions, relationships, or personal life.
-
-User's reflection so far:
-
-"{text[:500]}"
-
-Generate 1-2 clarifying questions about PERFORMANCE ONLY. Ask ONLY about: sleep, energy, focus, work output, what blocked them.
-
-BAD (therapeutic - never do this): "What's causing you to feel blue?", "Can you share more about your relationship?", "What do you think is missing?"
-GOOD (performance): "How did that affect your energy for work today?", "What got in the way of your focus?", "How did your sleep factor in?"
-
-Return JSON array only: ["question1?", "question2?"]."""
-        r = client.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": prompt}], temperature=0.4)
+        client = get_openai(OPENAI_KEY)
+        r = client.chat.completions.create(model="gpt-4o-mini", messages=clarify_messages(text), temperature=0.4)
         raw = r.choices[0].message.content.strip()
-        if raw.startswith("```"): raw = raw.split("```")[1].replace("json", "").strip()
-        out = json.loads(raw)
+        raw = strip_code_fence(raw)
+        out = orjson.loads(raw)
         questions = out if isinstance(out, list) else []
-        return jsonify({"questions": questions, "source": "gpt"})
+        body = {"questions": questions, "source": "gpt"}
+        gpt_cache.put(cache_key, body)
+        return jsonify(body)
     except Exception as e:
         print("[clarify] GPT error:", type(e).__name__, str(e))
-        return jsonify({"questions": _fallback_clarify(text), "source": "fallback", "error": str(e)})
+        return jsonify({"questions": fallback_clarify(text), "source": "fallback", "error": str(e)})
 
 
 @app.route("/api/transcribe", methods=["POST"])
@@ -843,9 +1017,6 @@ def transcribe():
         return jsonify({"error": "OPENAI_API_KEY not configured. Add it to .env for local dev, or Vercel Environment Variables for production.", "transcript": ""}), 503
 
     try:
-        import openai
-        with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as tmp:
-            file.save(tmp.name)
         prompt = (
             "Daily journal check-in about sleep quality, energy levels, deep work, "
             "focus, productivity, mood, stress, anxiety, motivation, exhaustion, "
@@ -853,11 +1024,12 @@ def transcribe():
             "screen time, hydration, napping, burnout, migraine, headache, workout, "
             "meditation, vibe coding, FaceTiming."
         )
-        with open(tmp.name, "rb") as f:
-            r = openai.OpenAI(api_key=OPENAI_KEY).audio.transcriptions.create(
-                model="whisper-1", file=f, language="en", prompt=prompt,
-            )
-        os.unlink(tmp.name)
+        # Upload straight from the request stream. The fixed filename tells Whisper the container
+        # format (browsers send MediaRecorder blobs as "blob"); pass the client's content type along.
+        r = get_openai(OPENAI_KEY).audio.transcriptions.create(
+            model="whisper-1", file=("audio.webm", file.stream, file.mimetype or "audio/webm"),
+            language="en", prompt=prompt,
+        )
         return jsonify({"transcript": r.text})
     except Exception as e:
         return jsonify({"error": str(e), "transcript": ""}), 500
@@ -865,21 +1037,45 @@ def transcribe():
 
 ALLOWED_STATIC_EXTENSIONS = {'.html', '.css', '.js', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.ico', '.webp', '.woff', '.woff2', '.ttf'}
 
+_STATIC_ROOT = os.path.realpath(app.root_path) + os.sep
+_SAFE_STATIC_PATH = re.compile(r"[A-Za-z0-9_./-]+")
+
+
+@lru_cache(maxsize=256)
+def _static_file_ok(path: str) -> bool:
+    """True if path resolves (symlinks included) to a regular file under the app root."""
+    full = os.path.realpath(_STATIC_ROOT + path)
+    return full.startswith(_STATIC_ROOT) and os.path.isfile(full)
+
+
+@lru_cache(maxsize=256)
+def _static_version(path: str) -> str:
+    """Content hash of a static file, for cache-busting ?v= parameters."""
+    with open(_STATIC_ROOT + path, "rb") as f:
+        return hashlib.blake2b(f.read(), digest_size=8).hexdigest()
+
+
 @app.route("/<path:path>")
 def serve_static(path):
     """Serve static files (css, js, etc.) that exist on disk."""
-    if ".." in path or path.startswith("/"):
-        return "Not Found", 404
-    resolved = os.path.realpath(os.path.join(".", path))
-    root = os.path.realpath(".")
-    if not resolved.startswith(root):
+    # The whitelist already rules out %-escapes, backslashes and NUL; realpath catches .. and symlinks
+    if path.startswith("/") or not _SAFE_STATIC_PATH.fullmatch(path):
         return "Not Found", 404
     ext = os.path.splitext(path)[1].lower()
     if ext not in ALLOWED_STATIC_EXTENSIONS:
         return "Not Found", 404
-    if os.path.isfile(resolved):
-        return send_from_directory(".", path)
-    return "Not Found", 404
+    # Cached so repeat hits skip the per-component lstat walk; debug mode re-checks for new files
+    if not (_static_file_ok.__wrapped__(path) if app.debug else _static_file_ok(path)):
+        return "Not Found", 404
+    resp = send_from_directory(".", path)
+    # Only a content-hash version (/css/signal.css?v=<_static_version>) is safe to cache for a year;
+    # a hand-bumped ?v=3 can go stale, so those keep send_from_directory's ETag revalidation
+    if request.args.get("v") and not app.debug and request.args["v"] == _static_version(path):
+        resp.cache_control.no_cache = None
+        resp.cache_control.public = True
+        resp.cache_control.max_age = 31536000
+        resp.cache_control.immutable = True
+    return resp
 
 
 if __name__ == "__main__":
@@ -887,4 +1083,8 @@ if __name__ == "__main__":
     print(f"Signal running at http://127.0.0.1:{port}/")
     if not OPENAI_KEY:
         print("WARNING: OPENAI_API_KEY not set in .env — analysis and voice transcription will fail.")
-    app.run(host="0.0.0.0", port=port, debug=os.environ.get("FLASK_DEBUG", "false").lower() == "true")
+    debug = os.environ.get("FLASK_DEBUG", "false").lower() == "true"
+    # With the reloader, only the child process (WERKZEUG_RUN_MAIN) serves requests
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_warm_up()
+    app.run(host="0.0.0.0", port=port, debug=debug)
@@ -0,0 +1,44 @@
+-- Run in Supabase SQL Editor (after supabase-upsert-entry.sql).
+-- Adds entries.updated_at (kept current by a trigger) and creates
+-- entries_version(): a cheap fingerprint of a user's entries.
+-- Idempotent: safe to run multiple times.
+--
+-- WHY: GET /api/entries re-fetched and re-decrypted up to 90 entries on every
+-- page load. The handler now sends an ETag built from this fingerprint and
+-- answers If-None-Match with 304. count(*) catches inserts and deletes;
+-- max(updated_at) catches overwrites by upsert_entry(p_overwrite => true).
+
+-- 1. Last-modified timestamp (existing rows get the migration time). Set by a
+--    trigger rather than relied on as a default, because upsert_entry() inserts
+--    a full record and would pass NULL explicitly.
+ALTER TABLE public.entries
+  ADD COLUMN IF NOT EXISTS updated_at timestamptz DEFAULT now();
+
+CREATE OR REPLACE FUNCTION public.entries_touch_updated_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  NEW.updated_at := now();
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS entries_touch_updated_at ON public.entries;
+CREATE TRIGGER entries_touch_updated_at
+  BEFORE INSERT OR UPDATE ON public.entries
+  FOR EACH ROW EXECUTE FUNCTION public.entries_touch_updated_at();
+
+-- 2. Fingerprint: "<count>:<max updated_at>"
+CREATE OR REPLACE FUNCTION public.entries_version(uid uuid)
+RETURNS text
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+AS $$
+  SELECT count(*)::text || ':' || coalesce(max(e.updated_at)::text, '')
+    FROM public.entries e
+   WHERE e.user_id = uid;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.entries_version(uuid) TO authenticated, service_role;
@@ -0,0 +1,30 @@
+-- Run in Supabase SQL Editor (after supabase-multi-entries.sql).
+-- Creates get_entry_with_day_meta(): one entry (only the columns the detail
+-- view uses) plus its day's entry count and highest entry_number, so the
+-- detail view needs a single round trip.
+-- Idempotent: safe to run multiple times.
+--
+-- WHY: GET /api/entries/<id> fetched the entry, then queried every entry_number
+-- for the same (user, date) just to work out is_final_for_day.
+-- The (user_id, date, entry_number) unique index from supabase-upsert-entry.sql
+-- covers both subqueries.
+
+CREATE OR REPLACE FUNCTION public.get_entry_with_day_meta(p_entry_id uuid, p_user_id uuid)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+AS $$
+  SELECT to_jsonb(x) FROM (
+    SELECT e.id, e.user_id, e.date, e.entry_number, e.is_follow_up, e.created_at,
+           e.sleep_hours, e.sleep_quality, e.energy, e.deep_work_blocks,
+           e.transcript, e.reflection_summary, e.likely_drivers,
+           e.predicted_impact, e.experiment_for_tomorrow,
+           (SELECT max(d.entry_number) FROM public.entries d WHERE d.user_id = e.user_id AND d.date = e.date) AS max_entry_number,
+           (SELECT count(*) FROM public.entries d WHERE d.user_id = e.user_id AND d.date = e.date) AS entry_count
+      FROM public.entries e
+     WHERE e.id = p_entry_id AND e.user_id = p_user_id
+  ) x;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.get_entry_with_day_meta(uuid, uuid) TO authenticated, service_role;
@@ -0,0 +1,34 @@
+-- Run in Supabase SQL Editor (after supabase-multi-entries.sql).
+-- Creates entry_lookup(): the day's entry count, highest entry_number and
+-- first entry's anchors as one JSON object.
+-- Idempotent: safe to run multiple times.
+--
+-- WHY: /api/analyze (server.py) used to fetch every entry for the day just to
+-- read the last entry_number and the first entry's sleep/energy values.
+-- Returns jsonb so it works whether the numeric columns are numeric or
+-- encrypted text (supabase-encrypt-numeric.sql).
+
+CREATE OR REPLACE FUNCTION public.entry_lookup(uid uuid, d date)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+AS $$
+  SELECT jsonb_build_object(
+    'count', count(*),
+    'max_number', max(e.entry_number),
+    'first', (
+      SELECT to_jsonb(f) FROM (
+        SELECT id, entry_number, sleep_hours, sleep_quality, energy, deep_work_blocks
+          FROM public.entries
+         WHERE user_id = uid AND date = d
+         ORDER BY entry_number ASC
+         LIMIT 1
+      ) f
+    )
+  )
+  FROM public.entries e
+  WHERE e.user_id = uid AND e.date = d;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.entry_lookup(uuid, date) TO authenticated, service_role;
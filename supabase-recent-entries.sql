@@ -0,0 +1,30 @@
+-- Run in Supabase SQL Editor (after supabase-multi-entries.sql).
+-- Creates get_recent_entries(): the first entry on each of a user's n most
+-- recent dates, newest first, with only the columns the weekly report reads.
+-- Idempotent: safe to run multiple times.
+--
+-- WHY: /api/weekly-report fetched 30 rows and deduplicated them by date in
+-- Python, so same-day follow-ups were transferred only to be thrown away.
+-- Returns jsonb so it works whether the numeric columns are numeric or
+-- encrypted text (supabase-encrypt-numeric.sql).
+
+CREATE OR REPLACE FUNCTION public.get_recent_entries(uid uuid, n int DEFAULT 14)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+AS $$
+  SELECT coalesce(jsonb_agg(to_jsonb(r) ORDER BY r.date DESC), '[]'::jsonb)
+    FROM (
+      SELECT DISTINCT ON (e.date)
+             e.date, e.entry_number, e.sleep_hours, e.sleep_quality, e.energy,
+             e.deep_work_blocks, e.reflection_summary, e.likely_drivers,
+             e.experiment_for_tomorrow
+        FROM public.entries e
+       WHERE e.user_id = uid
+       ORDER BY e.date DESC, e.entry_number ASC
+       LIMIT n
+    ) r;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.get_recent_entries(uuid, int) TO authenticated, service_role;
@@ -0,0 +1,22 @@
+-- Run in Supabase SQL Editor.
+-- Creates reminder_day_counts(): per-user distinct check-in days and whether
+-- they've checked in today, for the daily reminder cron.
+-- Idempotent: safe to run multiple times.
+--
+-- WHY: /api/send-reminders queried entries once per user (N round trips).
+-- This returns every user's counts in one call; users with no entries are
+-- simply absent from the result.
+
+CREATE OR REPLACE FUNCTION public.reminder_day_counts(p_user_ids uuid[], p_today date)
+RETURNS TABLE (user_id uuid, day_count bigint, checked_in_today boolean)
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+AS $$
+  SELECT e.user_id, count(DISTINCT e.date), bool_or(e.date = p_today)
+    FROM public.entries e
+   WHERE e.user_id = ANY(p_user_ids)
+   GROUP BY e.user_id;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.reminder_day_counts(uuid[], date) TO service_role;
@@ -0,0 +1,21 @@
+-- Run in Supabase SQL Editor.
+-- Creates unique_day_count(): how many distinct dates a user has logged.
+-- Idempotent: safe to run multiple times.
+--
+-- WHY: /api/entries/today fetched the user's latest 100 entry dates and
+-- counted the distinct ones in Python on every check-in page load. This
+-- returns the single integer instead (and isn't capped at 100 rows, so
+-- multi-entry days no longer undercount long-time users).
+
+CREATE OR REPLACE FUNCTION public.unique_day_count(uid uuid)
+RETURNS int
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+AS $$
+  SELECT count(DISTINCT e.date)::int
+    FROM public.entries e
+   WHERE e.user_id = uid;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.unique_day_count(uuid) TO authenticated, service_role;
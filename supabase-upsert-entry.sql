@@ -0,0 +1,80 @@
+-- Run in Supabase SQL Editor (after supabase-multi-entries.sql).
+-- Creates upsert_entry(): numbers and saves a check-in in one round trip.
+-- Idempotent: safe to run multiple times.
+--
+-- WHY: /api/analyze used to SELECT the day's entries to work out the next
+-- entry_number, then INSERT — two round trips and a race between them.
+-- This function takes a per-(user, date) transaction lock, computes the
+-- number server-side and inserts (or overwrites the latest entry).
+
+-- 1. One entry_number per user per date (also added by supabase-multi-entries.sql)
+CREATE UNIQUE INDEX IF NOT EXISTS entries_user_date_num
+  ON public.entries(user_id, date, entry_number);
+
+-- 2. Insert-or-overwrite. p_row holds entries columns as JSON; values are cast
+--    to the column types by jsonb_populate_record, so this works whether the
+--    numeric columns are still numeric or have been migrated to text.
+--    Follow-ups copy the sleep/energy anchors from the day's first entry.
+CREATE OR REPLACE FUNCTION public.upsert_entry(p_row jsonb, p_overwrite boolean DEFAULT false)
+RETURNS TABLE (id uuid, entry_number smallint, overwritten boolean)
+LANGUAGE plpgsql
+SECURITY INVOKER
+AS $$
+DECLARE
+  r public.entries;
+  first_entry public.entries;
+  latest_id uuid;
+  max_number smallint;
+BEGIN
+  r := jsonb_populate_record(NULL::public.entries, p_row);
+
+  PERFORM pg_advisory_xact_lock(hashtext(r.user_id::text || r.date::text));
+
+  SELECT e.id, e.entry_number INTO latest_id, max_number
+    FROM public.entries e
+   WHERE e.user_id = r.user_id AND e.date = r.date
+   ORDER BY e.entry_number DESC
+   LIMIT 1;
+
+  IF p_overwrite AND latest_id IS NOT NULL THEN
+    UPDATE public.entries e SET
+      sleep_hours = r.sleep_hours,
+      sleep_quality = r.sleep_quality,
+      energy = r.energy,
+      deep_work_blocks = r.deep_work_blocks,
+      transcript = r.transcript,
+      reflection_summary = r.reflection_summary,
+      likely_drivers = r.likely_drivers,
+      predicted_impact = r.predicted_impact,
+      experiment_for_tomorrow = r.experiment_for_tomorrow
+     WHERE e.id = latest_id;
+    RETURN QUERY SELECT latest_id, max_number, true;
+    RETURN;
+  END IF;
+
+  r.entry_number := coalesce(max_number, 0) + 1;
+  r.is_follow_up := coalesce(r.is_follow_up, false) AND r.entry_number > 1;
+
+  IF r.is_follow_up THEN
+    SELECT * INTO first_entry
+      FROM public.entries e
+     WHERE e.user_id = r.user_id AND e.date = r.date
+     ORDER BY e.entry_number ASC
+     LIMIT 1;
+    r.sleep_hours := coalesce(first_entry.sleep_hours, r.sleep_hours);
+    r.sleep_quality := coalesce(first_entry.sleep_quality, r.sleep_quality);
+    r.energy := coalesce(first_entry.energy, r.energy);
+    r.deep_work_blocks := coalesce(first_entry.deep_work_blocks, r.deep_work_blocks);
+  END IF;
+
+  r.id := coalesce(r.id, gen_random_uuid());
+  r.created_at := coalesce(r.created_at, now());
+  r.is_outlier := coalesce(r.is_outlier, false);
+  r.likely_drivers := coalesce(r.likely_drivers, '[]'::jsonb);
+
+  INSERT INTO public.entries SELECT r.*;
+  RETURN QUERY SELECT r.id, r.entry_number, false;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.upsert_entry(jsonb, boolean) TO authenticated, service_role;
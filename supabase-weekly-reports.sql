@@ -0,0 +1,32 @@
+-- Run in Supabase SQL Editor.
+-- Creates weekly_reports: generated weekly reports keyed by a hash of the
+-- entries they were built from.
+-- Idempotent: safe to run multiple times.
+--
+-- WHY: every POST /api/weekly-report called GPT (seconds, and billed) even
+-- when nothing had changed since the last view. The handler now reuses the
+-- stored report while the user's recent entries hash the same.
+-- report holds the JSON encrypted in application code, like reflections.
+
+CREATE TABLE IF NOT EXISTS public.weekly_reports (
+  user_id uuid NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+  digest_hash text NOT NULL,
+  report text NOT NULL,
+  created_at timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (user_id, digest_hash)
+);
+
+ALTER TABLE public.weekly_reports ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users read own weekly reports" ON public.weekly_reports;
+DROP POLICY IF EXISTS "Users insert own weekly reports" ON public.weekly_reports;
+
+CREATE POLICY "Users read own weekly reports"
+  ON public.weekly_reports FOR SELECT
+  TO authenticated
+  USING (auth.uid() = user_id);
+
+CREATE POLICY "Users insert own weekly reports"
+  ON public.weekly_reports FOR INSERT
+  TO authenticated
+  WITH CHECK (auth.uid() = user_id);
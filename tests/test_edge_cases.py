@@ -8,13 +8,16 @@ import json
 import os
 import sys
 import re
+import time
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from dotenv import load_dotenv
 load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env"))
 
-from api.security import encrypt, decrypt, sanitize_text, clamp_int, clamp_float, validate_date, validate_uuid
+import pytest
+
+from api.security import encrypt, decrypt, sanitize_text, clamp_int, clamp_float, validate_date, validate_email, validate_uuid, parse_checkin
 
 
 # ═══════════════════════════════════════════════
@@ -76,44 +79,168 @@ class TestInputValidation:
         assert validate_uuid("not-a-uuid") is None
         assert validate_uuid("") is None
 
+    def test_validate_email(self):
+        assert validate_email("  Someone@Example.com ") == "someone@example.com"
+        assert validate_email("@") is None
+        assert validate_email("a@") is None
+        assert validate_email("@b.com") is None
+        assert validate_email("a@b") is None
+        assert validate_email(None) is None
+
+    def test_parse_checkin(self):
+        data = {"transcript": " slept ok\x00 ", "sleep_hours": "30", "energy": "x", "deep_work_blocks": 2, "date": "2026-02-24"}
+        assert parse_checkin(data) == ("slept ok", 24, 3, 3, 2, "2026-02-24")
+        assert parse_checkin({})[5] is None
+
     def test_sql_injection_in_text(self):
         malicious = "'; DROP TABLE entries; --"
         cleaned = sanitize_text(malicious)
         assert cleaned == malicious.strip()  # sanitize_text doesn't strip SQL — Supabase uses parameterized queries
 
 
+class TestTokenVerification:
+    SECRET = "test-jwt-secret-at-least-32-bytes-long"
+
+    @pytest.fixture(autouse=True)
+    def _secret(self, monkeypatch):
+        import api.security as security
+        monkeypatch.setattr(security, "SUPABASE_JWT_SECRET", self.SECRET)
+        monkeypatch.setattr(security, "_JWT_SECRET_BYTES", self.SECRET.encode())
+        security._decode_verified.cache_clear()
+        yield
+        security._decode_verified.cache_clear()
+
+    def _header(self, **claims):
+        import jwt
+        payload = {"sub": "9c0b6185-ba12-4e3f-91d7-54d85a289e79", "aud": "authenticated", **claims}
+        return "Bearer " + jwt.encode(payload, self.SECRET, algorithm="HS256")
+
+    def test_valid_token(self):
+        from api.security import get_user_id
+        assert get_user_id(self._header(exp=int(time.time()) + 60)) == "9c0b6185-ba12-4e3f-91d7-54d85a289e79"
+        assert get_user_id(self._header(exp=int(time.time()) + 60, aud="anon")) is None
+
+    def test_cached_token_expiry_is_rechecked(self, monkeypatch):
+        from api.security import get_user_id
+        header = self._header(exp=int(time.time()) + 60)
+        assert get_user_id(header)
+        monkeypatch.setattr(time, "time", lambda: time.monotonic() + 10**10)
+        assert get_user_id(header) is None
+
+    def test_not_yet_valid_token_is_not_cached(self, monkeypatch):
+        # Supabase's clock running slightly ahead of ours must not lock a new session out
+        import functools
+        import jwt
+        from api.security import get_user_id
+        header = self._header(nbf=int(time.time()) + 30, exp=int(time.time()) + 600)
+        assert get_user_id(header) is None
+        # "Later": a minute of leeway stands in for our clock catching up. A cached
+        # rejection would never reach jwt.decode again.
+        monkeypatch.setattr(jwt, "decode", functools.partial(jwt.decode, leeway=60))
+        assert get_user_id(header) == "9c0b6185-ba12-4e3f-91d7-54d85a289e79"
+
+
+from api.transcribe import extract_audio
+
+class TestAudioExtraction:
+    AUDIO_PART = b'Content-Disposition: form-data; name="audio"; filename="a.webm"\r\nContent-Type: audio/webm\r\n\r\n'
+
+    def _body(self, *parts, preamble=b"", closing=b"--XyZ--\r\n"):
+        return preamble + b"".join(b"--XyZ\r\n" + p + b"\r\n" for p in parts) + closing
+
+    def test_single_part(self):
+        assert extract_audio(self._body(self.AUDIO_PART + b"\x1aE\xdf\xa3"), b"XyZ") == b"\x1aE\xdf\xa3"
+
+    def test_preamble_is_skipped(self):
+        raw = self._body(self.AUDIO_PART + b"abc", preamble=b"This is a preamble.\r\n")
+        assert extract_audio(raw, b"XyZ") == b"abc"
+
+    def test_non_audio_first_part(self):
+        text_part = b'Content-Disposition: form-data; name="lang"\r\n\r\nen'
+        assert extract_audio(self._body(text_part, self.AUDIO_PART + b"abc"), b"XyZ") == b"abc"
+
+    def test_body_containing_crlf(self):
+        # Only the CRLF before the next boundary belongs to the framing
+        data = b"ab\r\n\r\ncd\r\n"
+        assert extract_audio(self._body(self.AUDIO_PART + data), b"XyZ") == data
+
+    def test_missing_closing_boundary(self):
+        raw = b"--XyZ\r\n" + self.AUDIO_PART + b"abc"
+        assert extract_audio(raw, b"XyZ") == b"abc"
+
+    def test_no_audio_part(self):
+        text_part = b'Content-Disposition: form-data; name="lang"\r\n\r\nen'
+        assert extract_audio(self._body(text_part), b"XyZ") is None
+        assert extract_audio(b"--XyZ\r\nheaders without a blank line", b"XyZ") is None
+
+
 # ═══════════════════════════════════════════════
 # 3. BIAS DETECTION (test the client-side fallback)
 # ═══════════════════════════════════════════════
 
-from server import _fallback_check_topics
+from api.topics import fallback_check_topics
 
 class TestTopicChecker:
     def test_complete_reflection(self):
         text = "Slept 7 hours, felt pretty good. Worked on the project for 2 hours, had a meeting."
-        assert _fallback_check_topics(text) == []
+        assert fallback_check_topics(text) == []
 
     def test_missing_sleep(self):
         text = "Felt tired all day. Worked on my project and had a meeting with the team."
-        missing = _fallback_check_topics(text)
+        missing = fallback_check_topics(text)
         assert "How did you sleep?" in missing
 
     def test_missing_feeling(self):
         text = "Slept 8 hours. Worked on the project all morning, then had lunch."
-        missing = _fallback_check_topics(text)
+        missing = fallback_check_topics(text)
         assert "What are you feeling?" in missing
 
     def test_missing_activity(self):
         text = "Slept poorly, felt drained and anxious all day."
-        missing = _fallback_check_topics(text)
+        missing = fallback_check_topics(text)
         assert "What did you attempt?" in missing
 
     def test_everything_missing(self):
         text = "ok"
-        missing = _fallback_check_topics(text)
+        missing = fallback_check_topics(text)
         assert len(missing) == 3
 
 
+from api.clarify import fallback_clarify
+
+class TestClarifyFallback:
+    ENERGY = "How did that affect your energy for work today?"
+    SLEEP = "How did you sleep last night?"
+    FOCUS = "What got in the way of your focus?"
+    DEFAULT = "What got in the way of your best work today?"
+
+    def test_rule_priority(self):
+        # Rules fire in list order, not text order, and only the first two are kept
+        assert fallback_clarify("Stressed and tired, felt sad") == [self.ENERGY, self.SLEEP]
+        assert fallback_clarify("so tired and stressed") == [self.SLEEP, self.FOCUS]
+
+    def test_shared_question_not_repeated(self):
+        assert fallback_clarify("I feel down after a fight with my bf") == [self.ENERGY]
+
+    def test_word_boundaries(self):
+        assert fallback_clarify("I lost interest in the meeting") == [self.DEFAULT]
+        assert fallback_clarify("Feeling stressed out") == [self.FOCUS]
+        assert fallback_clarify("Restless night, low energy") == [self.SLEEP, "What might have affected your sleep quality?"]
+
+    def test_server_route_uses_shared_rules(self, monkeypatch):
+        # server.py used to have its own copy: "tired" came first and "woke"/"wake" weren't keywords
+        import server
+        monkeypatch.setattr(server, "OPENAI_KEY", "")
+        client = server.app.test_client()
+        ask = lambda text: client.post("/api/clarify", json={"text": text}).get_json()["questions"]
+        assert ask("Felt sad and tired all afternoon") == [self.ENERGY, self.SLEEP]
+        assert ask("Woke up at 5 and never got back") == ["What might have affected your sleep quality?"]
+
+    def test_phrases(self):
+        assert fallback_clarify("I just sat the whole day") == ["What got in the way of feeling productive today?"]
+        assert fallback_clarify("I don't feel like myself") == [self.ENERGY]
+
+
 # ═══════════════════════════════════════════════
 # 4. EDGE CASE REFLECTIONS (for GPT analysis)
 #    These are the test transcripts to run through
@@ -188,6 +315,150 @@ class TestEdgeCaseTranscripts:
         assert "worst" in neg or "sucked" in neg or "failure" in neg
 
 
+import importlib
+from types import SimpleNamespace
+
+analyze_mod = importlib.import_module("api.analyze")
+
+
+class _FakeOpenAI:
+    """Stands in for the OpenAI client: records each completion call and replies with fixed JSON."""
+
+    def __init__(self, reply: dict):
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self._reply = json.dumps(reply)
+
+    def _create(self, **kwargs):
+        self.calls.append(kwargs)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self._reply))])
+
+
+REPORT_FIELDS = ("reflection_summary", "core_bottleneck", "likely_drivers", "predicted_impact",
+                 "experiment_for_tomorrow", "micro_interventions", "is_outlier", "outlier_reason")
+
+
+class TestAnalyzeFollowUp:
+    def _run(self, monkeypatch, reply):
+        fake = _FakeOpenAI(reply)
+        monkeypatch.setattr(analyze_mod, "get_openai", lambda key: fake)
+        result = analyze_mod.analyze_with_gpt("Slept badly.", 5, 2, 2, 0, api_key="test", ask_follow_up=True)
+        return fake, result
+
+    def test_question_costs_one_call_and_no_report(self, monkeypatch):
+        reply = {"needs_answer": "How was your focus today?", **dict.fromkeys(REPORT_FIELDS)}
+        fake, result = self._run(monkeypatch, reply)
+        assert result == {"needs_answer": "How was your focus today?"}
+        assert len(fake.calls) == 1
+        # The schema lets the model leave the report null instead of writing one to be discarded
+        props = fake.calls[0]["response_format"]["json_schema"]["schema"]["properties"]
+        assert all("null" in props[f]["type"] for f in REPORT_FIELDS)
+
+    def test_no_question_returns_report_from_same_call(self, monkeypatch):
+        reply = {"needs_answer": None, "reflection_summary": "Short night.", "core_bottleneck": "Sleep debt.",
+                 "likely_drivers": ["Sleep restriction impairs executive function."], "predicted_impact": "Lower focus.",
+                 "experiment_for_tomorrow": "Bed by 11.", "micro_interventions": [], "is_outlier": False, "outlier_reason": None}
+        fake, result = self._run(monkeypatch, reply)
+        assert len(fake.calls) == 1
+        assert "needs_answer" not in result
+        assert result["reflection_summary"].endswith("Short night.")
+
+    def test_null_report_without_question_is_a_failure(self, monkeypatch):
+        fake, result = self._run(monkeypatch, {"needs_answer": None, **dict.fromkeys(REPORT_FIELDS)})
+        assert result["likely_drivers"] == ["Analysis pending"]
+
+
+class _FakeSupabase:
+    """Records table writes; entries holds the day's rows. rpc_reply=None simulates a missing upsert_entry."""
+
+    def __init__(self, entries, rpc_reply=None):
+        self.entries, self.rpc_reply, self.calls = entries, rpc_reply, []
+
+    def rpc(self, name, params):
+        self.calls.append(("rpc", name, params))
+        if self.rpc_reply is None:
+            from postgrest.exceptions import APIError
+            raise APIError({"message": f"Could not find the function public.{name}", "code": "PGRST202"})
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=[self.rpc_reply]))
+
+    def table(self, name):
+        return _FakeQuery(self)
+
+
+class _FakeQuery:
+    def __init__(self, db):
+        self.db, self.op, self.filters = db, "select", {}
+
+    def select(self, *args):
+        return self
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def eq(self, col, value):
+        self.filters[col] = value
+        return self
+
+    def insert(self, row):
+        self.op, self.row = "insert", row
+        return self
+
+    def update(self, row):
+        self.op, self.row = "update", row
+        return self
+
+    def execute(self):
+        if self.op == "select":
+            return SimpleNamespace(data=sorted(self.db.entries, key=lambda e: -e["entry_number"]))
+        self.db.calls.append((self.op, self.filters, self.row))
+        return SimpleNamespace(data=[{"id": "new-id"}] if self.op == "insert" else [])
+
+
+class TestAnalyzeSave:
+    DAY = [{"id": "e1", "entry_number": 1, "sleep_hours": 7, "sleep_quality": 4, "energy": 4, "deep_work_blocks": 2},
+           {"id": "e2", "entry_number": 2, "sleep_hours": 7, "sleep_quality": 4, "energy": 4, "deep_work_blocks": 2}]
+
+    def _post(self, monkeypatch, supabase, **body):
+        import io
+        monkeypatch.setattr(analyze_mod, "get_user_id", lambda header: "9c0b6185-ba12-4e3f-91d7-54d85a289e79")
+        monkeypatch.setattr(analyze_mod, "get_supabase", lambda: supabase)
+        monkeypatch.setattr(analyze_mod, "analyze_with_gpt", lambda *a, **k: {
+            "reflection_summary": "s", "likely_drivers": ["d"], "predicted_impact": "p", "experiment_for_tomorrow": "e"})
+        raw = json.dumps({"transcript": "Slept 7 hours, felt fine, worked on the report.", "date": "2026-02-24",
+                          "skip_missing_check": True, **body}).encode()
+        h = analyze_mod.handler.__new__(analyze_mod.handler)
+        h.headers = {"Content-Length": str(len(raw)), "Authorization": "Bearer x"}
+        h.rfile = io.BytesIO(raw)
+        sent = []
+        h._send = lambda status, payload: sent.append((status, payload))
+        h.do_POST()
+        return sent[0]
+
+    def test_overwrite_flag_reaches_upsert_entry(self, monkeypatch):
+        supabase = _FakeSupabase(self.DAY, rpc_reply={"id": "e2", "entry_number": 2, "overwritten": True})
+        status, body = self._post(monkeypatch, supabase, overwrite=True)
+        assert (status, body) == (200, {"entry_id": "e2", "entry_number": 2, "overwritten": True})
+        assert supabase.calls[0][2]["p_overwrite"] is True
+
+    def test_overwrite_updates_latest_entry_without_rpc(self, monkeypatch):
+        supabase = _FakeSupabase(self.DAY)
+        status, body = self._post(monkeypatch, supabase, overwrite=True)
+        assert (status, body) == (200, {"entry_id": "e2", "entry_number": 2, "overwritten": True})
+        writes = [c for c in supabase.calls if c[0] != "rpc"]
+        assert [(op, filters) for op, filters, _ in writes] == [("update", {"id": "e2"})]
+
+    def test_normal_save_gets_next_number(self, monkeypatch):
+        supabase = _FakeSupabase(self.DAY, rpc_reply={"id": "e3", "entry_number": 3, "overwritten": False})
+        assert self._post(monkeypatch, supabase) == (200, {"entry_id": "e3", "entry_number": 3})
+        assert supabase.calls[0][2]["p_overwrite"] is False
+
+    def test_normal_save_gets_next_number_without_rpc(self, monkeypatch):
+        supabase = _FakeSupabase(self.DAY)
+        assert self._post(monkeypatch, supabase) == (200, {"entry_id": "new-id", "entry_number": 3})
+        writes = [c for c in supabase.calls if c[0] != "rpc"]
+        assert len(writes) == 1 and writes[0][0] == "insert" and writes[0][2]["entry_number"] == 3
+
+
 # ═══════════════════════════════════════════════
 # 5. LIVE API TEST (requires running server)
 #    Run with: pytest tests/test_edge_cases.py -v -k live